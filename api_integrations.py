@@ -1,11 +1,22 @@
-import requests
 import os
-import json
 import logging
-from datetime import datetime
-from openai import OpenAI
+import asyncio
+import base64
+import hashlib
+import functools
+import re
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+import orjson
+from openai import AsyncOpenAI
 import mercadopago
 
+from database import get_cache_entry, get_cache_entry_with_expiry, set_cache_entry, set_cache_entries
+
 # Carregar variáveis de ambiente apenas se não estiverem já definidas (para Railway)
 from dotenv import load_dotenv
 load_dotenv(override=False)  # override=False evita sobrescrever variáveis já definidas
@@ -13,51 +24,229 @@ load_dotenv(override=False)  # override=False evita sobrescrever variáveis já
 API_FOOTBALL_KEY = os.getenv("API_FOOTBALL_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 MERCADOPAGO_ACCESS_TOKEN = os.getenv("MERCADOPAGO_ACCESS_TOKEN")
+# URL pública para onde o Mercado Pago envia as notificações (webhook) de pagamento
+MERCADOPAGO_WEBHOOK_URL = os.getenv("MERCADOPAGO_WEBHOOK_URL")
+# Máximo de requisições por segundo enviadas à API-Football
+API_FOOTBALL_RATE_LIMIT = int(os.getenv("API_FOOTBALL_RATE_LIMIT", "10"))
+# Confiança mínima (%) para um palpite ao vivo ser enviado; 0 desativa o corte
+AI_MIN_CONFIDENCE = float(os.getenv("AI_MIN_CONFIDENCE", "0"))
 
 logger = logging.getLogger(__name__)
 
+# Prefixo das chaves de cache: evita reaproveitar respostas obtidas com outra chave de API
+_API_KEY_HASH = hashlib.sha256((API_FOOTBALL_KEY or "").encode()).hexdigest()[:12]
+
 # --- API-Football Integration ---
 
+class ApiFootballError(RuntimeError):
+    """A API-Football respondeu 200 mas com o campo "errors" preenchido (cota, parâmetro, token)."""
+
 def get_api_football_headers():
     return {
         "x-rapidapi-host": "v3.football.api-sports.io",
-        "x-rapidapi-key": API_FOOTBALL_KEY
+        "x-rapidapi-key": API_FOOTBALL_KEY or ""
     }
 
-def get_fixtures_by_date(date: str): # date format YYYY-MM-DD
-    url = f"https://v3.football.api-sports.io/fixtures?date={date}"
-    headers = get_api_football_headers()
-    response = requests.get(url, headers=headers)
+class AsyncRateLimiter:
+    """
+    Limitador de taxa assíncrono (janela deslizante): permite no máximo `max_rate`
+    entradas a cada `period` segundos. Uso: `async with limiter: ...`.
+    """
+
+    def __init__(self, max_rate: int, period: float = 1.0):
+        self.max_rate = max_rate
+        self.period = period
+        self._timestamps: deque[float] = deque()
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._timestamps and now - self._timestamps[0] >= self.period:
+                    self._timestamps.popleft()
+                if len(self._timestamps) < self.max_rate:
+                    self._timestamps.append(now)
+                    return self
+                await asyncio.sleep(self.period - (now - self._timestamps[0]))
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+_api_football_limiter = AsyncRateLimiter(API_FOOTBALL_RATE_LIMIT, 1.0)
+
+# Cliente HTTP assíncrono compartilhado: reaproveita conexões keep-alive entre chamadas
+# e permite disparar várias requisições em paralelo com asyncio.gather.
+_client = None
+
+# Política de retry (equivalente ao Retry do urllib3): erros de conexão são repetidos
+# pelo transport; respostas 429/5xx são repetidas com backoff exponencial.
+_MAX_RETRIES = 3
+_BACKOFF_FACTOR = 0.3
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def get_api_football_client():
+    """Retorna o cliente httpx.AsyncClient compartilhado, criando-o sob demanda."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers=get_api_football_headers(),
+            timeout=10.0,
+            transport=httpx.AsyncHTTPTransport(
+                retries=_MAX_RETRIES,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+            )
+        )
+    return _client
+
+
+async def close_api_football_client():
+    """Fecha o cliente HTTP compartilhado (chamado no encerramento do bot)."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+@asynccontextmanager
+async def api_football_session():
+    """Context manager assíncrono que garante o fechamento do cliente ao final do uso."""
+    try:
+        yield get_api_football_client()
+    finally:
+        await close_api_football_client()
+
+
+async def _api_football_get(url: str):
+    """
+    Faz um GET na API-Football pelo cliente compartilhado e retorna o campo "response".
+    Repete a chamada com backoff exponencial quando a API responde 429 ou 5xx.
+    """
+    client = get_api_football_client()
+    for attempt in range(_MAX_RETRIES + 1):
+        async with _api_football_limiter:
+            response = await client.get(url)
+        if response.status_code not in _RETRY_STATUSES or attempt == _MAX_RETRIES:
+            break
+        await asyncio.sleep(_BACKOFF_FACTOR * (2 ** attempt))
     response.raise_for_status()
-    return response.json()["response"]
+    # orjson decodifica os payloads grandes (fixtures/estatísticas) bem mais rápido que o json padrão
+    payload = orjson.loads(response.content)
+    # Erros de cota/parâmetro vêm com status 200 e "response" vazio: levantar em vez de
+    # devolver [], para que o _disk_cached não guarde a falha como estatística válida por horas
+    if payload.get("errors"):
+        raise ApiFootballError(f"API-Football retornou erro: {payload['errors']}")
+    return payload["response"]
+
+
+def _disk_cached(namespace: str, ttl, key_func=None, memory_size: int = 0):
+    """
+    Decorator de cache persistente (tabela api_cache do SQLite) para fetchers assíncronos.
+    A chave é formada pelo hash da API key, o namespace e os argumentos da chamada
+    (ou o retorno de `key_func(*args)`). Apenas respostas bem-sucedidas são cacheadas.
+    `ttl` é o tempo em segundos, ou uma função `ttl(*args)` quando depende dos argumentos.
+    Com `memory_size > 0`, as últimas entradas também ficam num LRU em memória (mesmo TTL),
+    o que evita a consulta ao SQLite e a decodificação do JSON nos acessos repetidos.
+    """
+    def decorator(func):
+        memory = OrderedDict()  # cache_key -> (expires_at, valor)
+
+        def remember(cache_key, value, expires_at):
+            if memory_size:
+                memory[cache_key] = (expires_at, value)
+                memory.move_to_end(cache_key)
+                if len(memory) > memory_size:
+                    memory.popitem(last=False)
+
+        @functools.wraps(func)
+        async def wrapper(*args):
+            arg_key = key_func(*args) if key_func else args
+            cache_key = f"{_API_KEY_HASH}:{namespace}:{':'.join(map(str, arg_key))}"
+            entry = memory.get(cache_key)
+            if entry is not None:
+                if entry[0] > time.time():
+                    memory.move_to_end(cache_key)
+                    return entry[1]
+                del memory[cache_key]
+            # As consultas e gravações no SQLite rodam numa thread, fora do event loop
+            cached = await asyncio.to_thread(get_cache_entry_with_expiry, cache_key)
+            if cached is not None:
+                result = orjson.loads(cached[0])
+                remember(cache_key, result, cached[1])
+                return result
+            result = await func(*args)
+            entry_ttl = ttl(*args) if callable(ttl) else ttl
+            await asyncio.to_thread(set_cache_entry, cache_key, orjson.dumps(result).decode(), entry_ttl)
+            remember(cache_key, result, time.time() + entry_ttl)
+            return result
+        return wrapper
+    return decorator
+
+
+def _singleflight(func):
+    """
+    Decorator que junta chamadas simultâneas com os mesmos argumentos: a primeira dispara a
+    requisição numa task própria e as demais aguardam a mesma task, em vez de repetir a
+    chamada HTTP. Cancelar (ou estourar o timeout de) quem espera não cancela a requisição
+    compartilhada, então os outros chamadores continuam recebendo o resultado.
+    """
+    inflight: dict = {}
+
+    def forget(args, task):
+        inflight.pop(args, None)
+        # Evita o aviso "exception was never retrieved" quando ninguém mais espera
+        if not task.cancelled():
+            task.exception()
+
+    @functools.wraps(func)
+    async def wrapper(*args):
+        task = inflight.get(args)
+        if task is None:
+            task = asyncio.ensure_future(func(*args))
+            inflight[args] = task
+            task.add_done_callback(functools.partial(forget, args))
+        return await asyncio.shield(task)
+    return wrapper
+
+
+def _fixtures_ttl(date: str) -> int:
+    # A lista de jogos de um dia que já passou não muda mais; a de hoje/futuro pode mudar
+    if date < time.strftime("%Y-%m-%d"):
+        return 7 * 24 * 3600
+    return 300
+
+@_singleflight
+@_disk_cached("fixtures", ttl=_fixtures_ttl, memory_size=64)
+async def get_fixtures_by_date(date: str): # date format YYYY-MM-DD
+    url = f"https://v3.football.api-sports.io/fixtures?date={date}"
+    return await _api_football_get(url)
 
-def get_live_fixtures():
+async def get_live_fixtures():
     """Busca jogos que estão acontecendo ao vivo agora."""
     url = "https://v3.football.api-sports.io/fixtures?live=all"
-    headers = get_api_football_headers()
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()["response"]
+        return await _api_football_get(url)
     except Exception as e:
         logger.error(f"Erro ao buscar jogos ao vivo: {e}")
         return []
 
-def get_team_statistics(team_id: int, league_id: int, season: int):
+@_singleflight
+@_disk_cached("team_stats", ttl=6 * 3600, memory_size=512)
+async def get_team_statistics(team_id: int, league_id: int, season: int):
     url = f"https://v3.football.api-sports.io/teams/statistics?league={league_id}&team={team_id}&season={season}"
-    headers = get_api_football_headers()
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()["response"]
+    return await _api_football_get(url)
 
-def get_h2h_statistics(team_a_id: int, team_b_id: int):
+# H2H é simétrico: A x B e B x A compartilham a mesma entrada de cache
+@_singleflight
+@_disk_cached("h2h", ttl=24 * 3600, key_func=lambda a, b: sorted((a, b)), memory_size=512)
+async def get_h2h_statistics(team_a_id: int, team_b_id: int):
     url = f"https://v3.football.api-sports.io/fixtures/headtohead?h2h={team_a_id}-{team_b_id}"
-    headers = get_api_football_headers()
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()["response"]
+    return await _api_football_get(url)
 
-def get_fixture_result(fixture_id: int):
+@_singleflight
+async def get_fixture_result(fixture_id: int):
     """
     Busca o resultado final de um jogo específico pela API-Football.
     Retorna um dicionário com informações do jogo ou None em caso de erro.
@@ -73,11 +262,8 @@ def get_fixture_result(fixture_id: int):
     - fixture_data: dados brutos completos da fixture
     """
     url = f"https://v3.football.api-sports.io/fixtures?id={fixture_id}"
-    headers = get_api_football_headers()
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()["response"]
+        data = await _api_football_get(url)
         
         if not data:
             logger.warning(f"Nenhum dado encontrado para fixture_id={fixture_id}")
@@ -103,15 +289,106 @@ def get_fixture_result(fixture_id: int):
 
 # --- OpenAI Integration ---
 
-def analyze_and_predict(match_data: dict):
-    if not OPENAI_API_KEY:
-        logger.error("OPENAI_API_KEY não configurada. Verifique as variáveis de ambiente.")
+OPENAI_MODEL = "gpt-4.1-mini"
+_SYSTEM_PROMPT = "Você é um analista de apostas esportivas experiente e imparcial."
+_AI_CACHE_TTL = 12 * 3600
+
+# Linha "Confiança: X%" da resposta em texto do modelo
+_CONFIDENCE_RE = re.compile(r"Confiança:\s*(\d+(?:[.,]\d+)?)")
+
+# Quantidade máxima de jogos enviados em uma única requisição do modo em lote
+_BATCH_SIZE = 8
+
+# Timeouts (s) das chamadas à OpenAI; o lote gera bem mais tokens que um palpite avulso
+_OPENAI_TIMEOUT = 30.0
+_OPENAI_BATCH_TIMEOUT = 90.0
+
+# Cliente assíncrono compartilhado e limite de requisições simultâneas à OpenAI
+_aclient = None
+_openai_semaphore = asyncio.Semaphore(8)
+
+
+def get_openai_client():
+    """Retorna o cliente AsyncOpenAI compartilhado, ou None se não puder ser criado."""
+    global _aclient
+    if _aclient is None:
+        if not OPENAI_API_KEY:
+            logger.error("OPENAI_API_KEY não configurada. Verifique as variáveis de ambiente.")
+            return None
+        try:
+            _aclient = AsyncOpenAI(api_key=OPENAI_API_KEY)
+        except Exception as e:
+            logger.error(f"Erro ao inicializar cliente OpenAI: {e}")
+            return None
+    return _aclient
+
+
+async def close_openai_client():
+    """Fecha o cliente AsyncOpenAI compartilhado (chamado no encerramento do bot)."""
+    global _aclient
+    if _aclient is not None:
+        await _aclient.close()
+    _aclient = None
+
+
+def _dumps(data):
+    """
+    Serializa para JSON compacto com orjson (bem mais rápido que json.dumps e sem espaços,
+    o que economiza tokens no prompt). As chaves saem ordenadas, então o resultado também
+    serve como forma canônica para as chaves de cache.
+    """
+    return orjson.dumps(data, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS).decode()
+
+
+def _match_cache_key(match_data: dict, namespace: str = "ai"):
+    """Chave de cache estável para `match_data` (JSON canônico com chaves ordenadas)."""
+    digest = hashlib.sha256(_dumps(match_data).encode()).hexdigest()
+    return f"{namespace}:{OPENAI_MODEL}:{digest}"
+
+
+def _cached_completion(ttl: int):
+    """
+    Decorator de cache para as análises da OpenAI.
+    A chave é o sha256 de uma serialização canônica (chaves ordenadas) de `match_data`,
+    então uma nova tentativa do job ou o mesmo jogo com os mesmos dados não gera outra
+    chamada ao modelo. Respostas vazias (erros) não são cacheadas.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(match_data: dict, min_confidence: float = 0):
+            cache_key = _match_cache_key(match_data)
+            cached = await asyncio.to_thread(get_cache_entry, cache_key)
+            if cached is not None:
+                logger.info(f"Análise reaproveitada do cache para {match_data.get('home_team')} vs {match_data.get('away_team')}")
+                confidence = _parse_confidence(cached)
+                if min_confidence and confidence is not None and confidence < min_confidence:
+                    return None
+                return cached
+            result = await func(match_data, min_confidence)
+            if result:
+                await asyncio.to_thread(set_cache_entry, cache_key, result, ttl)
+            return result
+        return wrapper
+    return decorator
+
+
+def _parse_confidence(text: str):
+    """Extrai o valor (%) da linha "Confiança:" do texto do modelo, ou None se ainda não houver."""
+    match = _CONFIDENCE_RE.search(text)
+    if not match:
         return None
+    return float(match.group(1).replace(",", "."))
 
-    try:
-        client = OpenAI(api_key=OPENAI_API_KEY)
-    except Exception as e:
-        logger.error(f"Erro ao inicializar cliente OpenAI: {e}")
+
+@_cached_completion(ttl=_AI_CACHE_TTL)
+async def analyze_and_predict(match_data: dict, min_confidence: float = 0):
+    """
+    Gera o palpite de um jogo com a OpenAI, lendo a resposta em streaming.
+    Assim que a linha "Confiança:" termina de chegar, ela é conferida: se ficar abaixo de
+    `min_confidence` (%), o stream é fechado (o modelo para de gerar) e retorna None.
+    """
+    client = get_openai_client()
+    if not client:
         return None
 
     prompt = f"""
@@ -123,9 +400,9 @@ def analyze_and_predict(match_data: dict):
     Time Visitante: {match_data.get('away_team')}
     Horário: {match_data.get('match_time')}
 
-    Estatísticas do Time da Casa: {json.dumps(match_data.get('home_team_stats'))}
-    Estatísticas do Time Visitante: {json.dumps(match_data.get('away_team_stats'))}
-    Confrontos Diretos: {json.dumps(match_data.get('h2h'))}
+    Estatísticas do Time da Casa: {_dumps(match_data.get('home_team_stats'))}
+    Estatísticas do Time Visitante: {_dumps(match_data.get('away_team_stats'))}
+    Confrontos Diretos: {_dumps(match_data.get('h2h'))}
 
     Formato da Resposta:
     Análise: [resumo da análise]
@@ -136,33 +413,170 @@ def analyze_and_predict(match_data: dict):
     """
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini", # Usando o modelo gpt-4.1-mini conforme solicitado
-            messages=[
-                {"role": "system", "content": "Você é um analista de apostas esportivas experiente e imparcial."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
-        return response.choices[0].message.content
+        async with _openai_semaphore:
+            stream = await client.chat.completions.create(
+                model=OPENAI_MODEL, # Usando o modelo gpt-4.1-mini conforme solicitado
+                messages=[
+                    {"role": "system", "content": _SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7,
+                max_tokens=500,
+                stream=True,
+                timeout=_OPENAI_TIMEOUT
+            )
+            parts = []
+            # Linha ainda incompleta; só ela é reexaminada a cada chunk (e não o texto inteiro)
+            pending_line = ""
+            confidence_checked = not min_confidence
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if not text:
+                    continue
+                parts.append(text)
+                if confidence_checked:
+                    continue
+                # Só avalia a confiança quando a linha estiver completa (já chegou o "\n")
+                *complete_lines, pending_line = (pending_line + text).split("\n")
+                for line in complete_lines:
+                    if not line.lstrip().startswith("Confiança:"):
+                        continue
+                    confidence_checked = True
+                    confidence = _parse_confidence(line)
+                    if confidence is not None and confidence < min_confidence:
+                        await stream.close()
+                        logger.info(
+                            f"Palpite descartado para {match_data.get('home_team')} vs {match_data.get('away_team')}: "
+                            f"confiança {confidence:.0f}% abaixo do mínimo de {min_confidence:.0f}%"
+                        )
+                        return None
+                    break
+        # "Confiança:" na última linha, sem "\n" no final
+        if not confidence_checked and pending_line.lstrip().startswith("Confiança:"):
+            confidence = _parse_confidence(pending_line)
+            if confidence is not None and confidence < min_confidence:
+                return None
+        return "".join(parts) or None
     except Exception as e:
         logger.error(f"Erro ao chamar a API da OpenAI: {e}")
         return None
 
+def _parse_batch_prediction(item: dict):
+    """Normaliza um palpite do modo em lote para o formato usado pelo bot (confiança de 0 a 1)."""
+    def to_float(value):
+        return float(str(value).replace("%", "").replace(",", ".").strip())
+
+    return {
+        "analysis": str(item.get("analysis") or "N/A").strip(),
+        "prediction": str(item.get("prediction") or "N/A").strip(),
+        "confidence": to_float(item.get("confidence", 0)) / 100.0,
+        "market": str(item.get("market") or "N/A").strip(),
+        "suggested_odd": to_float(item.get("suggested_odd", 0)),
+    }
+
+async def _analyze_batch_chunk(client, matches: list, chunk: list):
+    """Envia um lote de jogos (índices em `chunk`) numa única requisição e retorna {índice: palpite}."""
+    payload = {"matches": [{"index": index, **matches[index]} for index in chunk]}
+
+    prompt = f"""
+    Analise cada um dos jogos de futebol abaixo para gerar um palpite esportivo por jogo. Considere as estatísticas dos times, forma recente, confrontos diretos e o fator mandante/visitante. Cada palpite deve incluir um nível de confiança (0 a 100), o melhor mercado (ex: resultado final, ambas marcam, over/under) e a odd sugerida.
+
+    Jogos (JSON):
+    {_dumps(payload)}
+
+    Formato da Resposta (apenas JSON, um item por jogo, mantendo o mesmo "index"):
+    {{"predictions": [{{"index": 0, "analysis": "resumo da análise", "prediction": "palpite", "confidence": 75, "market": "melhor mercado", "suggested_odd": 1.85}}]}}
+    """
+
+    try:
+        async with _openai_semaphore:
+            response = await client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": _SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.7,
+                max_tokens=400 * len(chunk),
+                timeout=_OPENAI_BATCH_TIMEOUT
+            )
+        predictions = orjson.loads(response.choices[0].message.content).get("predictions", [])
+    except Exception as e:
+        logger.error(f"Erro ao chamar a API da OpenAI (lote de {len(chunk)} jogos): {e}")
+        return {}
+
+    parsed = {}
+    for item in predictions:
+        try:
+            index = int(item["index"])
+            if index in chunk:
+                parsed[index] = _parse_batch_prediction(item)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Palpite inválido na resposta em lote da OpenAI ({item}): {e}")
+    return parsed
+
+async def analyze_and_predict_batch(matches: list):
+    """
+    Analisa vários jogos com poucas requisições à OpenAI (até _BATCH_SIZE jogos por chamada),
+    amortizando o prompt de sistema e os round-trips de rede. Os lotes são enviados em paralelo.
+
+    Retorna uma lista alinhada com `matches`: para cada jogo, um dicionário com
+    analysis, prediction, confidence (0 a 1), market e suggested_odd, ou None se o
+    jogo não pôde ser analisado. Jogos já analisados (cache) não são reenviados.
+    """
+    results = [None] * len(matches)
+    pending = []
+    cache_keys = [_match_cache_key(match_data, "ai_batch") for match_data in matches]
+    # Todas as consultas ao cache numa única ida à thread, fora do event loop
+    cached_values = await asyncio.to_thread(lambda: [get_cache_entry(key) for key in cache_keys])
+    for index, cached in enumerate(cached_values):
+        if cached is not None:
+            results[index] = orjson.loads(cached)
+        else:
+            pending.append(index)
+
+    if not pending:
+        return results
+
+    client = get_openai_client()
+    if not client:
+        return results
+
+    chunks = [pending[start:start + _BATCH_SIZE] for start in range(0, len(pending), _BATCH_SIZE)]
+    new_entries = []
+    for parsed in await asyncio.gather(*[_analyze_batch_chunk(client, matches, chunk) for chunk in chunks]):
+        for index, prediction in parsed.items():
+            results[index] = prediction
+            new_entries.append((cache_keys[index], orjson.dumps(prediction).decode()))
+    # Uma única transação para todas as análises novas, gravada numa thread
+    await asyncio.to_thread(set_cache_entries, new_entries, _AI_CACHE_TTL)
+
+    return results
+
 # --- Mercado Pago Integration ---
 
+@functools.lru_cache(maxsize=1)
 def get_mercadopago_sdk():
+    """
+    Retorna a instância única da SDK do Mercado Pago (criada na primeira chamada),
+    reaproveitando a sessão HTTP interna entre pagamentos. Como o resultado fica em
+    cache, o erro de configuração ausente é logado apenas uma vez.
+    """
     if not MERCADOPAGO_ACCESS_TOKEN:
         logger.error("MERCADOPAGO_ACCESS_TOKEN não configurada. Verifique as variáveis de ambiente.")
         return None
     sdk = mercadopago.SDK(MERCADOPAGO_ACCESS_TOKEN)
     return sdk
 
-def create_payment(plan_details: dict, user_id: int):
+def create_payment(plan_details: dict, user_id: int, username: Optional[str] = None):
     """
     Cria um pagamento via Mercado Pago usando a SDK atualizada.
     A SDK atual requer sdk.payment().create() com parênteses em payment().
+    Os dados do plano e do usuário vão em `metadata`, para que o webhook consiga
+    ativar a assinatura apenas com o ID do pagamento.
     """
     sdk = get_mercadopago_sdk()
     if not sdk:
@@ -180,8 +594,16 @@ def create_payment(plan_details: dict, user_id: int):
         "payer": {
             "email": f"user_{user_id}@example.com", # Email fictício para o payer
         },
-        "external_reference": f"zeus_tips_sub_{user_id}_{datetime.now().timestamp()}"
+        "external_reference": f"zeus_tips_sub_{user_id}_{time.time_ns()}",
+        "metadata": {
+            "user_id": str(user_id),
+            "username": username or "",
+            "plan_title": title,
+            "duration_days": str(plan_details.get("duration_days", 30)),
+        }
     }
+    if MERCADOPAGO_WEBHOOK_URL:
+        payment_data["notification_url"] = MERCADOPAGO_WEBHOOK_URL
 
     try:
         # SDK atualizada: sdk.payment().create() com parênteses em payment()
@@ -189,11 +611,13 @@ def create_payment(plan_details: dict, user_id: int):
         payment = preference_response["response"]
         
         if payment and payment.get("point_of_interaction") and payment["point_of_interaction"].get("transaction_data"):
-            qr_code_base64 = payment["point_of_interaction"]["transaction_data"]["qr_code_base64"]
-            qr_code_text = payment["point_of_interaction"]["transaction_data"]["qr_code"]
+            transaction_data = payment["point_of_interaction"]["transaction_data"]
+            # O Mercado Pago só devolve o PNG em base64: decodificar uma única vez, aqui
+            qr_code_png = base64.b64decode(transaction_data["qr_code_base64"])
+            qr_code_text = transaction_data["qr_code"]
             payment_id = payment["id"]
             logger.info(f"Pagamento criado com sucesso. ID: {payment_id}")
-            return {"qr_code_base64": qr_code_base64, "qr_code_text": qr_code_text, "payment_id": payment_id}
+            return {"qr_code_png": qr_code_png, "qr_code_text": qr_code_text, "payment_id": payment_id}
         else:
             error_msg = payment.get('message', 'Resposta inesperada do Mercado Pago')
             logger.error(f"Erro ao criar pagamento: {error_msg}")
@@ -205,10 +629,10 @@ def create_payment(plan_details: dict, user_id: int):
         logger.error(f"Erro ao criar pagamento no Mercado Pago: {e}")
         return None
 
-def check_payment_status(payment_id: str):
+def get_payment(payment_id: str):
     """
-    Verifica o status de um pagamento via Mercado Pago.
-    A SDK atual requer sdk.payment().get() com parênteses em payment().
+    Busca os dados completos de um pagamento no Mercado Pago (GET /v1/payments/{id}).
+    Retorna o dicionário do pagamento ou None em caso de erro.
     """
     sdk = get_mercadopago_sdk()
     if not sdk:
@@ -218,12 +642,10 @@ def check_payment_status(payment_id: str):
     try:
         # SDK atualizada: sdk.payment().get() com parênteses em payment()
         payment_info = sdk.payment().get(payment_id)
-        
+
         if payment_info and payment_info["response"]:
-            status = payment_info["response"]["status"]
-            logger.info(f"Status do pagamento {payment_id}: {status}")
-            return status # Ex: "pending", "approved", "rejected"
-        
+            return payment_info["response"]
+
         logger.warning(f"Resposta vazia ao verificar pagamento {payment_id}")
         return None
     except AttributeError as e:
@@ -232,3 +654,16 @@ def check_payment_status(payment_id: str):
     except Exception as e:
         logger.error(f"Erro ao verificar status do pagamento no Mercado Pago: {e}")
         return None
+
+def check_payment_status(payment_id: str):
+    """
+    Verifica o status de um pagamento via Mercado Pago.
+    Usado como reconciliação (/status) caso a notificação do webhook não chegue.
+    """
+    payment = get_payment(payment_id)
+    if not payment:
+        return None
+
+    status = payment.get("status")
+    logger.info(f"Status do pagamento {payment_id}: {status}")
+    return status # Ex: "pending", "approved", "rejected"
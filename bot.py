@@ -1,24 +1,47 @@
 import os
 import logging
-from datetime import datetime, timedelta, time
-import sqlite3
-import json
-import io
-import base64
+from datetime import date, datetime, timedelta, timezone, time
 import asyncio
-import re
-
+import functools
+import hashlib
+import hmac
+import heapq
+import itertools
+import signal
+from operator import itemgetter
+from time import monotonic
+from typing import Any, Optional, Union
+from urllib.parse import urlparse
+
+import httpx
+from aiohttp import web
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
+from telegram.error import RetryAfter
+from telegram.ext import (
+    Application, ContextTypes, CallbackQueryHandler, ChatMemberHandler, MessageHandler, filters
+)
 from dotenv import load_dotenv
 
-from api_integrations import get_fixtures_by_date, get_live_fixtures, get_team_statistics, get_h2h_statistics, analyze_and_predict, create_payment, check_payment_status, get_fixture_result
+from api_integrations import (
+    get_fixtures_by_date, get_live_fixtures, get_team_statistics, get_h2h_statistics,
+    analyze_and_predict, analyze_and_predict_batch, create_payment, check_payment_status,
+    get_payment, get_fixture_result, close_api_football_client, close_openai_client,
+    MERCADOPAGO_WEBHOOK_URL, AI_MIN_CONFIDENCE, AsyncRateLimiter, ApiFootballError
+)
+from bot_hot import (
+    format_prediction_message, format_live_prediction_message,
+    build_daily_multiple_message, evaluate_prediction, parse_ai_response, format_match_time_brt
+)
 from database import (
-    init_db, get_setting, set_setting, add_subscriber, get_subscriber,
-    update_subscriber_status, get_all_active_subscribers, add_prediction_history,
-    get_all_subscribers, get_pending_predictions, update_prediction_result,
-    get_daily_predictions_summary
+    init_db, get_setting, set_setting, get_subscriber, get_subscriber_status, activate_subscriber_for_payment,
+    add_prediction_history_bulk,
+    get_subscriber_ids_by_activity, get_pending_predictions, expire_subscriptions_due,
+    update_prediction_results_bulk,
+    get_daily_summary_stats, register_payment_event, get_admin_stats,
+    set_pending_payment, get_pending_payment, get_pending_payments, delete_pending_payment,
+    set_vip_member_status, set_vip_member_statuses, get_vip_member_statuses, run_maintenance, close_db_pool
 )
+from scheduler import BRAZIL_TZ
 
 # Carregar variáveis de ambiente
 load_dotenv(override=False)
@@ -27,6 +50,19 @@ TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 ADMIN_USER_ID = int(os.getenv("ADMIN_USER_ID")) if os.getenv("ADMIN_USER_ID") else None
 # A variável VIP_CHANNEL_ID será lida do banco de dados. A variável de ambiente serve como fallback inicial.
 VIP_CHANNEL_ID_ENV = os.getenv("VIP_CHANNEL_ID")
+# Porta do servidor HTTP que recebe os webhooks do Mercado Pago e do Telegram (Railway define PORT)
+WEBHOOK_PORT = int(os.getenv("PORT", "8080"))
+# Chave secreta das notificações do Mercado Pago (painel de Webhooks), usada para conferir o header x-signature
+MERCADOPAGO_WEBHOOK_SECRET = os.getenv("MERCADOPAGO_WEBHOOK_SECRET")
+# URL pública para o Telegram entregar os updates. Sem ela, o bot usa polling.
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL")
+# Token conferido no header X-Telegram-Bot-Api-Secret-Token; por padrão derivado do token do bot
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET") or (
+    hashlib.sha256(TELEGRAM_BOT_TOKEN.encode()).hexdigest()[:32] if TELEGRAM_BOT_TOKEN else None
+)
+# Só os tipos de update que o bot trata (comandos, inclusive em mensagens editadas, botões
+# e entradas/saídas do canal VIP)
+ALLOWED_UPDATES = [Update.MESSAGE, Update.EDITED_MESSAGE, Update.CALLBACK_QUERY, Update.CHAT_MEMBER]
 
 # Configurar logging
 logging.basicConfig(
@@ -59,184 +95,26 @@ PRIORITY_LEAGUES = {
     1: "Copa do Mundo",
     4: "Euro (Eurocopa)",
 }
+# Conjunto só de IDs para os filtros de fixtures; o dict fica para os nomes
+PRIORITY_LEAGUE_IDS: frozenset[int] = frozenset(PRIORITY_LEAGUES)
+# Tipos de competição aceitos nos palpites diários (a API também lista amistosos etc.)
+_LEAGUE_TYPES = frozenset({"league", "cup"})
 
+# Tempo máximo (s) para processar um jogo; um jogo travado não segura o job inteiro
+DAILY_FIXTURE_TIMEOUT = 20
+# Jogos processados ao mesmo tempo no envio diário (3 consultas à API-Football cada)
+DAILY_FIXTURE_CONCURRENCY = 5
+LIVE_FIXTURE_TIMEOUT = 45
 
-# =====================================================
-# MELHORIA 1 & 2 - Classificação de Odds e Gestão de Banca
-# =====================================================
-
-def classify_odd(odd_value):
-    """
-    Classifica a odd sugerida e retorna o emoji, a classificação e a % da banca.
-    - 🟢 SEGURA: odds até 1.50 → 5% da banca
-    - 🟡 MÉDIA: odds entre 1.51 e 2.00 → 3% da banca
-    - 🔴 ALTA: odds acima de 2.00 → 1-2% da banca
-    """
-    try:
-        odd = float(odd_value)
-    except (ValueError, TypeError):
-        odd = 0.0
-
-    if odd <= 1.50:
-        return "🟢 SEGURA", "5%"
-    elif odd <= 2.00:
-        return "🟡 MÉDIA", "3%"
-    else:
-        return "🔴 ALTA", "1-2%"
-
-
-def format_prediction_message(pred, header="⚡ ZEUS TIPS - PALPITE DO DIA ⚡"):
-    """
-    Formata a mensagem de um palpite individual incluindo:
-    - Classificação de odd (Melhoria 1)
-    - Gestão de banca (Melhoria 2)
-    """
-    odd_class, banca_pct = classify_odd(pred.get("suggested_odd", 0))
-
-    message_text = f"{header}\n"
-    message_text += f"🏆 Campeonato: {pred['championship']}\n"
-    message_text += f"⚽ Jogo: {pred['team_a']} vs {pred['team_b']}\n"
-    message_text += f"⏰ Horário: {pred['match_time']}\n"
-    message_text += f"📊 Análise: {pred['analysis']}\n"
-    message_text += f"🎯 Palpite: {pred['prediction']} ({pred.get('market', 'N/A')})\n"
-    message_text += f"📈 Confiança: {pred['confidence'] * 100:.0f}%\n"
-    message_text += f"💰 Odd sugerida: {pred['suggested_odd']:.2f} {odd_class}\n"
-    message_text += f"💼 Gestão: Aposte {banca_pct} da sua banca\n"
-
-    return message_text
-
-
-def format_live_prediction_message(pred, home_goals, away_goals, elapsed):
-    """
-    Formata a mensagem de um palpite ao vivo incluindo:
-    - Classificação de odd (Melhoria 1)
-    - Gestão de banca (Melhoria 2)
-    """
-    odd_class, banca_pct = classify_odd(pred.get("suggested_odd", 0))
-
-    message_text = f"🔴 ZEUS TIPS - AO VIVO 🔴\n"
-    message_text += f"🏆 Campeonato: {pred['championship']}\n"
-    message_text += f"⚽ Jogo: {pred['team_a']} {home_goals} x {away_goals} {pred['team_b']}\n"
-    message_text += f"⏱ Tempo: {elapsed}'\n"
-    message_text += f"📊 Análise: {pred['analysis']}\n"
-    message_text += f"🎯 Palpite: {pred['prediction']} ({pred.get('market', 'N/A')})\n"
-    message_text += f"📈 Confiança: {pred['confidence'] * 100:.0f}%\n"
-    message_text += f"💰 Odd sugerida: {pred['suggested_odd']:.2f} {odd_class}\n"
-    message_text += f"💼 Gestão: Aposte {banca_pct} da sua banca\n"
-
-    return message_text
-
-
-# =====================================================
-# MELHORIA 3 - Múltipla Diária (função auxiliar)
-# =====================================================
-
-def build_daily_multiple_message(all_predictions):
-    """
-    Constrói a mensagem da aposta múltipla diária.
-    Seleciona os 3 palpites com maior confiança e calcula a odd combinada.
-    """
-    if len(all_predictions) < 3:
-        return None
-
-    # Já devem estar ordenados por confiança (desc), pegar os 3 primeiros
-    top3 = all_predictions[:3]
-    combined_odd = 1.0
-    for p in top3:
-        combined_odd *= p["suggested_odd"]
-
-    message = "🔱 ZEUS TIPS - MÚLTIPLA DO DIA 🔱\n"
-    message += "━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
-
-    for i, p in enumerate(top3, 1):
-        odd_class, _ = classify_odd(p["suggested_odd"])
-        message += f"🎯 Jogo {i}:\n"
-        message += f"   🏆 {p['championship']}\n"
-        message += f"   ⚽ {p['team_a']} vs {p['team_b']}\n"
-        message += f"   📊 Palpite: {p['prediction']} ({p.get('market', 'N/A')})\n"
-        message += f"   💰 Odd: {p['suggested_odd']:.2f} {odd_class}\n"
-        message += f"   📈 Confiança: {p['confidence'] * 100:.0f}%\n\n"
-
-    message += "━━━━━━━━━━━━━━━━━━━━━━━━\n"
-    message += f"💰 Odd combinada: {combined_odd:.2f}\n"
-    message += f"💼 Gestão: Aposte 1% da sua banca para múltiplas\n"
-    message += "━━━━━━━━━━━━━━━━━━━━━━━━\n"
-    message += "⚠️ Múltiplas possuem risco elevado. Aposte com responsabilidade!"
-
-    return message
+# Status da API-Football em que não faz sentido enviar palpite ao vivo (intervalo ou jogo encerrado)
+_LIVE_SKIP_STATUSES = frozenset({"HT", "FT", "AET", "PEN", "PST", "CANC", "ABD"})
 
 
 # =====================================================
 # MELHORIA 4 - Verificação de Resultados (RED/GREEN)
+# Classificação de odds, formatação e avaliação ficam em bot_hot.py
 # =====================================================
 
-def evaluate_prediction(prediction_text, fixture_result):
-    """
-    Compara o palpite dado com o resultado real do jogo.
-    Retorna 'green' se acertou, 'red' se errou.
-    
-    Lógica de avaliação:
-    - Resultado Final (1X2): compara com o vencedor real
-    - Over/Under: compara com total de gols
-    - Ambas Marcam: verifica se ambos os times marcaram
-    """
-    if not fixture_result:
-        return None
-
-    home_goals = fixture_result.get("home_goals", 0) or 0
-    away_goals = fixture_result.get("away_goals", 0) or 0
-    total_goals = home_goals + away_goals
-    home_team = fixture_result.get("home_team", "").lower()
-    away_team = fixture_result.get("away_team", "").lower()
-
-    pred_lower = prediction_text.lower().strip()
-
-    # --- Avaliação de Over/Under ---
-    over_match = re.search(r'over\s*(\d+[.,]?\d*)', pred_lower)
-    if over_match:
-        line = float(over_match.group(1).replace(",", "."))
-        return "green" if total_goals > line else "red"
-
-    under_match = re.search(r'under\s*(\d+[.,]?\d*)', pred_lower)
-    if under_match:
-        line = float(under_match.group(1).replace(",", "."))
-        return "green" if total_goals < line else "red"
-
-    # --- Avaliação de Ambas Marcam ---
-    if "ambas marcam" in pred_lower or "btts" in pred_lower:
-        if "não" in pred_lower or "no" in pred_lower:
-            return "green" if (home_goals == 0 or away_goals == 0) else "red"
-        else:
-            return "green" if (home_goals > 0 and away_goals > 0) else "red"
-
-    # --- Avaliação de Resultado Final (1X2) ---
-    # Verificar se o palpite menciona vitória de um time
-    home_words = home_team.split()
-    away_words = away_team.split()
-
-    pred_mentions_home = any(w in pred_lower for w in home_words if len(w) > 3)
-    pred_mentions_away = any(w in pred_lower for w in away_words if len(w) > 3)
-
-    if "empate" in pred_lower or "draw" in pred_lower:
-        return "green" if home_goals == away_goals else "red"
-
-    if "vitória" in pred_lower or "vencer" in pred_lower or "win" in pred_lower or "ganha" in pred_lower:
-        if pred_mentions_home and not pred_mentions_away:
-            return "green" if home_goals > away_goals else "red"
-        elif pred_mentions_away and not pred_mentions_home:
-            return "green" if away_goals > home_goals else "red"
-
-    # Se menciona o nome do time diretamente como palpite
-    if pred_mentions_home and not pred_mentions_away:
-        return "green" if home_goals > away_goals else "red"
-    elif pred_mentions_away and not pred_mentions_home:
-        return "green" if away_goals > home_goals else "red"
-
-    # Fallback: se não conseguiu interpretar, marca como red por segurança
-    logger.warning(f"Não foi possível avaliar o palpite '{prediction_text}' com precisão. Marcando como 'red'.")
-    return "red"
-
-
 async def check_results(context: ContextTypes.DEFAULT_TYPE):
     """
     MELHORIA 4: Verifica os resultados dos jogos palpitados.
@@ -244,30 +122,45 @@ async def check_results(context: ContextTypes.DEFAULT_TYPE):
     Envia notificação no canal VIP para cada resultado.
     """
     logger.info("Iniciando verificação de resultados (GREEN/RED)...")
-    vip_channel_id = await get_vip_channel_id_from_db()
+    vip_channel_id = get_vip_channel_id_from_db()
 
-    pending = get_pending_predictions()
+    pending = await asyncio.to_thread(get_pending_predictions)
     if not pending:
         logger.info("Nenhum palpite pendente para verificar.")
         return
 
     logger.info(f"Verificando {len(pending)} palpites pendentes...")
 
+    to_check = []
     for pred_row in pending:
-        pred_id = pred_row[0]
-        fixture_id = pred_row[1]
-        championship = pred_row[2]
-        team_a = pred_row[3]
-        team_b = pred_row[4]
-        prediction_text = pred_row[6]
-        suggested_odd = pred_row[8]
-
-        if not fixture_id:
-            logger.warning(f"Palpite ID={pred_id} sem fixture_id. Pulando.")
+        if not pred_row[1]:
+            logger.warning(f"Palpite ID={pred_row[0]} sem fixture_id. Pulando.")
+            continue
+        to_check.append(pred_row)
+
+    # Buscar os resultados em paralelo, com no máximo 5 requisições simultâneas
+    # (a taxa de requisições à API-Football é limitada em api_integrations)
+    semaphore = asyncio.Semaphore(5)
+
+    async def fetch_result(pred_row):
+        async with semaphore:
+            return await get_fixture_result(pred_row[1])
+
+    fixture_results = await asyncio.gather(
+        *[fetch_result(pred_row) for pred_row in to_check],
+        return_exceptions=True
+    )
+
+    resolved = []
+    notifications = []
+
+    for pred_row, fixture_result in zip(to_check, fixture_results):
+        pred_id, fixture_id, championship, team_a, team_b, prediction_text, suggested_odd = pred_row
+
+        if isinstance(fixture_result, Exception):
+            logger.error(f"Erro ao buscar resultado da fixture {fixture_id}: {fixture_result}")
             continue
 
-        # Buscar resultado do jogo na API
-        fixture_result = get_fixture_result(fixture_id)
         if not fixture_result:
             logger.info(f"Resultado não disponível para fixture {fixture_id}. Mantendo pendente.")
             continue
@@ -283,11 +176,10 @@ async def check_results(context: ContextTypes.DEFAULT_TYPE):
         if not result:
             continue
 
-        # Salvar resultado no banco
-        update_prediction_result(pred_id, result)
+        resolved.append((result, pred_id))
         logger.info(f"Palpite ID={pred_id} ({team_a} vs {team_b}): {result.upper()}")
 
-        # Enviar notificação no canal VIP
+        # Preparar notificação para o canal VIP
         if vip_channel_id:
             home_goals = fixture_result.get("home_goals", 0) or 0
             away_goals = fixture_result.get("away_goals", 0) or 0
@@ -309,14 +201,17 @@ async def check_results(context: ContextTypes.DEFAULT_TYPE):
                     f"🎯 Palpite: {prediction_text}\n"
                     f"📉 Perda: -1.00 unidade por unidade apostada"
                 )
+            notifications.append(msg)
 
-            try:
-                await context.bot.send_message(chat_id=vip_channel_id, text=msg)
-            except Exception as e:
-                logger.error(f"Erro ao enviar resultado no canal VIP: {e}")
+    # Salvar todos os resultados no banco numa única transação, antes de notificar
+    if resolved:
+        await asyncio.to_thread(update_prediction_results_bulk, resolved)
 
-        # Pequeno delay entre verificações para não sobrecarregar a API
-        await asyncio.sleep(2)
+    for msg in notifications:
+        try:
+            await telegram_sender.send_message(context.bot, vip_channel_id, text=msg)
+        except Exception as e:
+            logger.error(f"Erro ao enviar resultado no canal VIP: {e}")
 
     logger.info("Verificação de resultados concluída.")
 
@@ -325,47 +220,34 @@ async def check_results(context: ContextTypes.DEFAULT_TYPE):
 # MELHORIA 5 - ROI Diário
 # =====================================================
 
+# Emoji, sinal e frase de fechamento do resumo conforme o ROI do dia (positivo ou negativo)
+_ROI_STYLES = {
+    True: ("📈", "+", "✨ Dia positivo! Continuamos firmes! ⚡"),
+    False: ("📉", "", "💪 Dia difícil, mas seguimos com disciplina e gestão!"),
+}
+
 async def send_daily_summary(context: ContextTypes.DEFAULT_TYPE):
     """
     MELHORIA 5: Envia o resumo diário de resultados no canal VIP às 23:00 BRT.
     Calcula total de palpites, greens, reds e ROI do dia.
     """
     logger.info("Gerando resumo diário de resultados...")
-    vip_channel_id = await get_vip_channel_id_from_db()
+    vip_channel_id = get_vip_channel_id_from_db()
     if not vip_channel_id:
         logger.warning("VIP_CHANNEL_ID não configurado. Resumo diário não será enviado.")
         return
 
-    today = datetime.now().strftime("%Y-%m-%d")
-    predictions = get_daily_predictions_summary(today)
+    now = datetime.now()
+    today = now.date().isoformat()
+    # Contagens, lucro (green = odd - 1, red = -1) e unidades apostadas numa única consulta
+    total, greens, reds, pending_count, total_profit, total_staked = (
+        await asyncio.to_thread(get_daily_summary_stats, today)
+    )
 
-    if not predictions:
+    if not total:
         logger.info("Nenhum palpite registrado hoje para o resumo.")
         return
 
-    total = len(predictions)
-    greens = 0
-    reds = 0
-    pending_count = 0
-    total_profit = 0.0
-    total_staked = 0.0
-
-    for pred in predictions:
-        # pred: (id, fixture_id, prediction, confidence, suggested_odd, result)
-        result = pred[5]
-        suggested_odd = pred[4] or 0.0
-
-        if result == "green":
-            greens += 1
-            total_profit += (suggested_odd - 1)  # Lucro = odd - 1
-            total_staked += 1
-        elif result == "red":
-            reds += 1
-            total_profit -= 1  # Perda = 1 unidade
-            total_staked += 1
-        else:
-            pending_count += 1
-
     # Calcular ROI
     resolved = greens + reds
     if total_staked > 0:
@@ -376,30 +258,35 @@ async def send_daily_summary(context: ContextTypes.DEFAULT_TYPE):
     green_pct = (greens / resolved * 100) if resolved > 0 else 0
     red_pct = (reds / resolved * 100) if resolved > 0 else 0
 
-    roi_emoji = "📈" if roi >= 0 else "📉"
-    roi_sign = "+" if roi >= 0 else ""
-
-    message = "📊 ZEUS TIPS - RESUMO DO DIA 📊\n"
-    message += "━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
-    message += f"📅 Data: {datetime.now().strftime('%d/%m/%Y')}\n\n"
-    message += f"📋 Total de palpites: {total}\n"
-    message += f"✅ Greens: {greens} ({green_pct:.0f}%)\n"
-    message += f"❌ Reds: {reds} ({red_pct:.0f}%)\n"
+    roi_emoji, roi_sign, closing_line = _ROI_STYLES[roi >= 0]
+
+    parts = [
+        "📊 ZEUS TIPS - RESUMO DO DIA 📊",
+        "━━━━━━━━━━━━━━━━━━━━━━━━",
+        "",
+        f"📅 Data: {now.strftime('%d/%m/%Y')}",
+        "",
+        f"📋 Total de palpites: {total}",
+        f"✅ Greens: {greens} ({green_pct:.0f}%)",
+        f"❌ Reds: {reds} ({red_pct:.0f}%)",
+    ]
 
     if pending_count > 0:
-        message += f"⏳ Pendentes: {pending_count}\n"
-
-    message += f"\n{roi_emoji} ROI do dia: {roi_sign}{roi:.1f}%\n"
-    message += f"💰 Lucro/Prejuízo: {roi_sign}{total_profit:.2f} unidades\n"
-    message += "\n━━━━━━━━━━━━━━━━━━━━━━━━\n"
+        parts.append(f"⏳ Pendentes: {pending_count}")
+
+    parts += [
+        "",
+        f"{roi_emoji} ROI do dia: {roi_sign}{roi:.1f}%",
+        f"💰 Lucro/Prejuízo: {roi_sign}{total_profit:.2f} unidades",
+        "",
+        "━━━━━━━━━━━━━━━━━━━━━━━━",
+    ]
 
-    if roi >= 0:
-        message += "✨ Dia positivo! Continuamos firmes! ⚡"
-    else:
-        message += "💪 Dia difícil, mas seguimos com disciplina e gestão!"
+    parts.append(closing_line)
+    message = "\n".join(parts)
 
     try:
-        await context.bot.send_message(chat_id=vip_channel_id, text=message)
+        await telegram_sender.send_message(context.bot, vip_channel_id, text=message)
         logger.info("Resumo diário enviado com sucesso.")
     except Exception as e:
         logger.error(f"Erro ao enviar resumo diário: {e}")
@@ -407,34 +294,115 @@ async def send_daily_summary(context: ContextTypes.DEFAULT_TYPE):
 
 # --- Funções Auxiliares ---
 
-async def get_vip_channel_id_from_db():
+# Orçamento global das chamadas à Bot API feitas em massa (envios e verificação de membros),
+# abaixo do limite de ~30 req/s do Telegram
+_telegram_api_limiter = AsyncRateLimiter(25, 1.0)
+
+class TelegramSender:
     """
-    Obtém o VIP_CHANNEL_ID numérico do banco de dados.
-    É crucial que o ID seja o número inteiro do canal (ex: -1001234567890),
-    não o link ou o hash.
+    Envio de mensagens com controle de ritmo: no máximo o orçamento global de
+    _telegram_api_limiter e uma mensagem a cada `per_chat_interval` segundos por chat.
+    Em RetryAfter (429), espera o tempo pedido pelo Telegram e tenta de novo.
     """
-    vip_channel_id = get_setting("VIP_CHANNEL_ID")
-    if not vip_channel_id and VIP_CHANNEL_ID_ENV:
-        logger.info("VIP_CHANNEL_ID não encontrado no banco. Usando variável de ambiente como fallback.")
-        vip_channel_id = VIP_CHANNEL_ID_ENV
-        set_setting("VIP_CHANNEL_ID", vip_channel_id)
-    
-    if vip_channel_id:
-        # Limpar caracteres inválidos (=, espaços, etc.)
-        vip_channel_id = str(vip_channel_id).strip().lstrip('=')
-    
+
+    def __init__(self, per_chat_interval: float = 1.0, max_retries: int = 3):
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self._chat_locks: dict[Union[int, str], asyncio.Lock] = {}
+        self._chat_next_send: dict[Union[int, str], float] = {}
+
+    async def send_message(self, bot, chat_id, **kwargs):
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            wait = self._chat_next_send.get(chat_id, 0.0) - monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with _telegram_api_limiter:
+                        message = await bot.send_message(chat_id=chat_id, **kwargs)
+                    break
+                except RetryAfter as e:
+                    if attempt == self.max_retries:
+                        raise
+                    logger.warning(f"Telegram pediu para aguardar {e.retry_after}s antes de enviar para {chat_id}.")
+                    await asyncio.sleep(e.retry_after)
+            self._chat_next_send[chat_id] = monotonic() + self.per_chat_interval
+            return message
+
+telegram_sender = TelegramSender()
+
+# Limite de texto do Telegram é 4096 caracteres; deixamos uma margem
+TELEGRAM_BATCH_LIMIT = 4000
+_BATCH_SEPARATOR = "\n\n━━━\n\n"
+
+async def flush_batch(bot, chat_id, parts, limit=TELEGRAM_BATCH_LIMIT, separator=_BATCH_SEPARATOR):
+    """
+    Envia vários textos para o mesmo chat agrupados no menor número de mensagens,
+    respeitando o limite de caracteres do Telegram (uma parte maior que o limite vai sozinha).
+    As mensagens saem em sequência, na ordem das partes.
+    Retorna os índices das partes efetivamente entregues.
+    """
+    chunks = []  # (texto, índices das partes)
+    current, current_len, current_idx = [], 0, []
+    for i, part in enumerate(parts):
+        extra = len(part) + (len(separator) if current else 0)
+        if current and current_len + extra > limit:
+            chunks.append((separator.join(current), current_idx))
+            current, current_len, current_idx = [], 0, []
+            extra = len(part)
+        current.append(part)
+        current_idx.append(i)
+        current_len += extra
+    if current:
+        chunks.append((separator.join(current), current_idx))
+
+    delivered = []
+    for text, indices in chunks:
+        try:
+            await telegram_sender.send_message(bot, chat_id, text=text)
+            delivered.extend(indices)
+        except Exception as e:
+            logger.error(f"Erro ao enviar lote de {len(indices)} mensagens para {chat_id}: {e}")
+    return delivered
+
+@functools.lru_cache(maxsize=8)
+def _parse_vip_channel_id(raw_value):
+    """Converte o valor salvo em ID numérico (memoizado: o valor quase nunca muda)."""
+    # Limpar caracteres inválidos (=, espaços, etc.)
+    vip_channel_id = str(raw_value).strip().lstrip('=')
     try:
         return int(vip_channel_id) if vip_channel_id else None
     except (ValueError, TypeError):
         logger.error(f"VIP_CHANNEL_ID configurado ({vip_channel_id}) não é um ID numérico válido.")
         return None
 
+def get_vip_channel_id_from_db():
+    """
+    Obtém o VIP_CHANNEL_ID numérico do banco de dados (get_setting já mantém o valor em cache).
+    É crucial que o ID seja o número inteiro do canal (ex: -1001234567890),
+    não o link ou o hash.
+    """
+    # Sem escrita aqui: a função roda no event loop, e o fallback da variável de ambiente
+    # é gravado no banco uma única vez no post_init (persist_vip_channel_env_fallback)
+    vip_channel_id = get_setting("VIP_CHANNEL_ID") or VIP_CHANNEL_ID_ENV
+    return _parse_vip_channel_id(vip_channel_id) if vip_channel_id else None
+
+def persist_vip_channel_env_fallback() -> None:
+    """
+    Grava no banco o VIP_CHANNEL_ID da variável de ambiente quando o banco ainda não tem um.
+    Bloqueia até o commit do writer: deve rodar fora do event loop (asyncio.to_thread).
+    """
+    if not get_setting("VIP_CHANNEL_ID") and VIP_CHANNEL_ID_ENV:
+        logger.info("VIP_CHANNEL_ID não encontrado no banco. Usando variável de ambiente como fallback.")
+        set_setting("VIP_CHANNEL_ID", VIP_CHANNEL_ID_ENV)
+
 async def generate_vip_invite_link(context: ContextTypes.DEFAULT_TYPE):
     """
     Gera um link de convite de uso único para o canal VIP.
     O link expira em 24 horas e só pode ser usado por 1 pessoa.
     """
-    vip_channel_id = await get_vip_channel_id_from_db()
+    vip_channel_id = get_vip_channel_id_from_db()
     if not vip_channel_id:
         logger.error("PROTEÇÃO 1: Falha ao gerar link. VIP_CHANNEL_ID numérico não configurado.")
         return "#ERRO_CANAL_VIP_NAO_CONFIGURADO"
@@ -454,64 +422,135 @@ async def generate_vip_invite_link(context: ContextTypes.DEFAULT_TYPE):
 
 async def check_subscriptions_expiration(context: ContextTypes.DEFAULT_TYPE):
     logger.info("Verificando expiração de assinaturas...")
-    active_subscribers = get_all_active_subscribers()
-    now = datetime.now()
+    expired_user_ids = await asyncio.to_thread(expire_subscriptions_due)
 
-    for user_id, end_date_str in active_subscribers:
-        end_date = datetime.strptime(end_date_str, "%Y-%m-%d %H:%M:%S")
-        if now > end_date:
-            update_subscriber_status(user_id, "expired")
-            logger.info(f"Assinatura do usuário {user_id} expirada.")
-            try:
-                await context.bot.send_message(chat_id=user_id, text=
-                    "Sua assinatura Zeus Tips expirou. Para continuar recebendo nossos palpites VIP, "
-                    "por favor, renove sua assinatura usando o comando /assinar."
-                )
-            except Exception as e:
-                logger.error(f"Erro ao notificar usuário {user_id} sobre expiração: {e}")
+    async def notify_expired(user_id):
+        logger.info(f"Assinatura do usuário {user_id} expirada.")
+        try:
+            await telegram_sender.send_message(context.bot, user_id, text=
+                "Sua assinatura Zeus Tips expirou. Para continuar recebendo nossos palpites VIP, "
+                "por favor, renove sua assinatura usando o comando /assinar."
+            )
+        except Exception as e:
+            logger.error(f"Erro ao notificar usuário {user_id} sobre expiração: {e}")
+
+    # Só as assinaturas que venceram desde a última execução (busca pelo índice status/end_date)
+    logger.info(f"{len(expired_user_ids)} assinaturas expiradas nesta verificação.")
+    if expired_user_ids:
+        await asyncio.gather(*(notify_expired(user_id) for user_id in expired_user_ids))
+
+async def activate_subscription(context, user_id, username, plan_title, duration_days, payment_id):
+    """
+    Ativa a assinatura de um pagamento aprovado e retorna o link de convite do canal VIP.
+    Retorna None se o pagamento já tinha sido usado para ativar uma assinatura, o que torna
+    seguro chamar esta função pelo webhook, pelo /status e pela conferência de pendentes.
+    O pagamento só fica marcado como usado junto com a gravação da assinatura (mesma
+    transação); se o link falhar depois disso, o /status gera um novo para o assinante ativo.
+    `context` pode ser o contexto de um handler ou a própria Application (ambos expõem `.bot`).
+    """
+    end_date = (datetime.now() + timedelta(days=duration_days)).isoformat(sep=" ", timespec="seconds")
+    activated = await asyncio.to_thread(
+        activate_subscriber_for_payment, payment_id, user_id, username, plan_title, end_date
+    )
+    if not activated:
+        logger.info(f"Pagamento {payment_id} já ativou uma assinatura anteriormente. Ignorando.")
+        return None
+
+    logger.info(f"Assinatura {plan_title} ativada para o usuário {user_id} (pagamento {payment_id}).")
+    return await generate_vip_invite_link(context)
+
+def build_activation_message(plan_title, vip_invite_link):
+    if vip_invite_link.startswith("#ERRO"):
+        # A assinatura já está gravada: o /status gera um novo link para o assinante ativo
+        access = "Não conseguimos gerar seu link do canal VIP agora. Use /status em alguns minutos para receber o link.\n\n"
+    else:
+        access = f"Acesse o canal VIP com seu link exclusivo (válido por 24h): {vip_invite_link}\n\n"
+    return (
+        f"🎉 Parabéns! Seu pagamento foi **APROVADO**!\n\n"\
+        f"Sua assinatura **{plan_title}** está ativa.\n"\
+        f"{access}"\
+        "Bem-vindo ao time Zeus Tips! ⚡"
+    )
 
 # --- Comandos do Bot ---
 
+# Textos fixos das respostas, montados uma única vez na carga do módulo
+_START_TEMPLATE = (
+    "Olá, {mention}! 👋\n\n"\
+    "Bem-vindo ao **Zeus Tips**! Seu canal automatizado de palpites esportivos de futebol.\n\n"\
+    "Aqui você encontra as melhores análises e previsões para suas apostas, "\
+    "geradas por inteligência artificial avançada e baseadas em dados estatísticos "\
+    "detalhados de jogos de futebol.\n\n"\
+    "Use os comandos abaixo para interagir:\n\n"\
+    "/palpites - Veja uma prévia dos nossos palpites (limitado para não assinantes)\n"\
+    "/assinar - Conheça nossos planos e torne-se um membro VIP para acesso exclusivo a todos os palpites!\n"\
+    "/status - Verifique o status da sua assinatura\n"\
+    "/ajuda - Obtenha mais informações sobre como o bot funciona\n\n"\
+    "Pronto para elevar suas apostas? Vamos nessa! ⚡"
+)
+
+_HELP_TEXT = (
+    "Aqui estão os comandos que você pode usar:\n\n"\
+    "/start - Mensagem de boas-vindas e apresentação do Zeus Tips\n"\
+    "/palpites - Mostrar prévia dos palpites (versão limitada para não assinantes)\n"\
+    "/assinar - Mostrar planos e gerar pagamento Pix\n"\
+    "/status - Verificar status da sua assinatura\n"\
+    "/ajuda - Explicar como funciona\n\n"\
+    "Para administradores (apenas o dono do bot):\n"\
+    "/admin_jogos [data YYYY-MM-DD] - Indicar jogos específicos para análise\n"\
+    "/admin_forcar_envio - Forçar o envio de palpites agora\n"\
+    "/admin_estatisticas - Ver estatísticas do bot\n"\
+    "/admin_setchannel [ID_numerico_do_canal] - Configurar o ID do canal VIP\n"\
+    "/admin_verificar_resultados - Forçar verificação de resultados"
+)
+
+_SUBSCRIBE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Plano Mensal (R$ 29,90)", callback_data='plan_mensal')],
+    [InlineKeyboardButton("Plano Trimestral (R$ 69,90)", callback_data='plan_trimestral')],
+    [InlineKeyboardButton("Plano Vitalício (R$ 197,00)", callback_data='plan_vitalicio')],
+])
+
+# Prévia exibida quando não há jogos (ou a análise falha) no /palpites
+_PREVIEW_PLACEHOLDER_TEXT = (
+    "Aqui está uma prévia dos nossos palpites (limitado para não assinantes):\n\n"\
+    "⚡ ZEUS TIPS - PRÉVIA ⚡\n"\
+    "🏆 Campeonato: Exemplo de Campeonato\n"\
+    "⚽ Jogo: Time da Casa vs Time Visitante\n"\
+    "⏰ Horário: HH:MM BRT\n"\
+    "📊 Análise: Análise resumida do jogo.\n"\
+    "🎯 Palpite: Palpite (Mercado)\n"\
+    "📈 Confiança: XX%\n"\
+    "💰 Odd sugerida: X.XX\n\n"\
+    "Para ter acesso a todos os palpites e análises completas, torne-se um membro VIP! Use /assinar."
+)
+
+SUBSCRIPTION_PLANS = {
+    "plan_mensal": {"title": "Plano Mensal", "price": 29.90, "duration_days": 30},
+    "plan_trimestral": {"title": "Plano Trimestral", "price": 69.90, "duration_days": 90},
+    "plan_vitalicio": {"title": "Plano Vitalício", "price": 197.00, "duration_days": 36500},
+}
+
+# Textos do fluxo de pagamento: o de cada plano só depende do plano, então é montado uma vez
+_PLAN_CHOSEN_TEXTS = {
+    key: f"Você escolheu o {plan['title']} no valor de R$ {plan['price']:.2f}.\n\n"
+         "Para finalizar a assinatura, realize o pagamento via Pix usando o QR Code acima ou o código copia e cola abaixo."
+    for key, plan in SUBSCRIPTION_PLANS.items()
+}
+_PAYMENT_INSTRUCTIONS_TEXT = (
+    "Após o pagamento, aguarde alguns minutos para a confirmação. "
+    "Você será notificado automaticamente e receberá o link do canal VIP!\n\n"
+    "Use /status para verificar a confirmação do seu pagamento."
+)
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
-    await update.message.reply_html(
-        f"Olá, {user.mention_html()}! 👋\n\n"\
-        "Bem-vindo ao **Zeus Tips**! Seu canal automatizado de palpites esportivos de futebol.\n\n"\
-        "Aqui você encontra as melhores análises e previsões para suas apostas, "\
-        "geradas por inteligência artificial avançada e baseadas em dados estatísticos "\
-        "detalhados de jogos de futebol.\n\n"\
-        "Use os comandos abaixo para interagir:\n\n"\
-        "/palpites - Veja uma prévia dos nossos palpites (limitado para não assinantes)\n"\
-        "/assinar - Conheça nossos planos e torne-se um membro VIP para acesso exclusivo a todos os palpites!\n"\
-        "/status - Verifique o status da sua assinatura\n"\
-        "/ajuda - Obtenha mais informações sobre como o bot funciona\n\n"\
-        "Pronto para elevar suas apostas? Vamos nessa! ⚡"
-    )
+    await update.effective_message.reply_html(_START_TEMPLATE.format(mention=user.mention_html()))
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await update.message.reply_text(
-        "Aqui estão os comandos que você pode usar:\n\n"\
-        "/start - Mensagem de boas-vindas e apresentação do Zeus Tips\n"\
-        "/palpites - Mostrar prévia dos palpites (versão limitada para não assinantes)\n"\
-        "/assinar - Mostrar planos e gerar pagamento Pix\n"\
-        "/status - Verificar status da sua assinatura\n"\
-        "/ajuda - Explicar como funciona\n\n"\
-        "Para administradores (apenas o dono do bot):\n"\
-        "/admin_jogos [data YYYY-MM-DD] - Indicar jogos específicos para análise\n"\
-        "/admin_forcar_envio - Forçar o envio de palpites agora\n"\
-        "/admin_estatisticas - Ver estatísticas do bot\n"\
-        "/admin_setchannel [ID_numerico_do_canal] - Configurar o ID do canal VIP\n"\
-        "/admin_verificar_resultados - Forçar verificação de resultados"
-    )
+    await update.effective_message.reply_text(_HELP_TEXT)
 
 async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    keyboard = [
-        [InlineKeyboardButton("Plano Mensal (R$ 29,90)", callback_data='plan_mensal')],
-        [InlineKeyboardButton("Plano Trimestral (R$ 69,90)", callback_data='plan_trimestral')],
-        [InlineKeyboardButton("Plano Vitalício (R$ 197,00)", callback_data='plan_vitalicio')],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text("Escolha seu plano de assinatura VIP:", reply_markup=reply_markup)
+    await update.effective_message.reply_text("Escolha seu plano de assinatura VIP:", reply_markup=_SUBSCRIBE_MARKUP)
 
 async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
@@ -519,36 +558,28 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
     user_id = query.from_user.id
     username = query.from_user.username or query.from_user.first_name
 
-    plans = {
-        "plan_mensal": {"title": "Plano Mensal", "price": 29.90, "duration_days": 30},
-        "plan_trimestral": {"title": "Plano Trimestral", "price": 69.90, "duration_days": 90},
-        "plan_vitalicio": {"title": "Plano Vitalício", "price": 197.00, "duration_days": 36500},
-    }
-
-    selected_plan = plans.get(query.data)
+    # callback_data já é a chave do plano: um lookup no dicionário, sem parse
+    selected_plan = SUBSCRIPTION_PLANS.get(query.data)
 
     if selected_plan:
-        payment_info = create_payment(selected_plan, user_id)
+        # O SDK do Mercado Pago é síncrono; em thread, um clique não trava os demais updates
+        payment_info = await asyncio.to_thread(create_payment, selected_plan, user_id, username)
         if payment_info:
-            qr_code_base64 = payment_info["qr_code_base64"]
+            qr_code_png = payment_info["qr_code_png"]
             qr_code_text = payment_info["qr_code_text"]
             payment_id = payment_info["payment_id"]
 
-            context.user_data["current_payment_id"] = payment_id
-            context.user_data["current_plan"] = selected_plan
+            # No banco, e não em user_data: o pagamento sobrevive a um redeploy
+            await asyncio.to_thread(set_pending_payment, user_id, payment_id, query.data)
 
             try:
-                qr_img_data = base64.b64decode(qr_code_base64)
-                await context.bot.send_photo(chat_id=user_id, photo=qr_img_data)
+                await context.bot.send_photo(chat_id=user_id, photo=qr_code_png)
             except Exception as e:
                 logger.error(f"Erro ao enviar imagem do QR Code: {e}")
                 await query.edit_message_text("Houve um erro ao gerar a imagem do QR Code. Por favor, tente novamente.")
                 return
 
-            await query.edit_message_text(
-                f"Você escolheu o {selected_plan['title']} no valor de R$ {selected_plan['price']:.2f}.\n\n"
-                f"Para finalizar a assinatura, realize o pagamento via Pix usando o QR Code acima ou o código copia e cola abaixo."
-            )
+            await query.edit_message_text(_PLAN_CHOSEN_TEXTS[query.data])
 
             await context.bot.send_message(
                 chat_id=user_id,
@@ -556,54 +587,119 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
                 parse_mode='Markdown'
             )
 
-            await context.bot.send_message(
-                chat_id=user_id,
-                text="Após o pagamento, aguarde alguns minutos para a confirmação. "
-                     "Você será notificado automaticamente e receberá o link do canal VIP!\n\n"
-                     "Use /status para verificar a confirmação do seu pagamento."
-            )
+            await context.bot.send_message(chat_id=user_id, text=_PAYMENT_INSTRUCTIONS_TEXT)
         else:
             await query.edit_message_text("Houve um erro ao gerar o pagamento. Por favor, tente novamente mais tarde.")
     else:
         await query.edit_message_text("Plano inválido selecionado.")
 
+# Status recentes de pagamentos consultados pelo /status: quem repete o comando enquanto
+# o Pix está pendente não gera uma chamada ao Mercado Pago a cada vez
+_PAYMENT_STATUS_CACHE_TTL = 20
+_payment_status_cache: dict[Union[int, str], tuple[Optional[str], float]] = {}
+
+async def get_payment_status_cached(payment_id):
+    entry = _payment_status_cache.get(payment_id)
+    if entry and entry[1] > monotonic():
+        return entry[0]
+
+    # O SDK do Mercado Pago é síncrono: a consulta roda numa thread
+    payment_status = await asyncio.to_thread(check_payment_status, payment_id)
+    if payment_status == "approved":
+        # Status final: a assinatura é ativada em seguida, não há o que repetir
+        _payment_status_cache.pop(payment_id, None)
+    else:
+        now = monotonic()
+        if len(_payment_status_cache) >= 1024:
+            # Descarta as entradas vencidas para o dicionário não crescer sem limite
+            for key in [k for k, (_, expires_at) in _payment_status_cache.items() if expires_at <= now]:
+                del _payment_status_cache[key]
+        _payment_status_cache[payment_id] = (payment_status, now + _PAYMENT_STATUS_CACHE_TTL)
+    return payment_status
+
+# Conferência periódica dos Pix pendentes: a ativação não depende do usuário rodar /status
+# (nem do webhook do Mercado Pago chegar). Só os pagamentos gerados na última hora são
+# consultados; os mais antigos ainda podem ser confirmados pelo /status.
+_PENDING_PAYMENT_MIN_AGE = 10
+_PENDING_PAYMENT_MAX_AGE = 3600
+_PENDING_PAYMENT_CONCURRENCY = 5
+
+async def poll_pending_payments(context: ContextTypes.DEFAULT_TYPE) -> None:
+    pending_payments = await asyncio.to_thread(
+        get_pending_payments, _PENDING_PAYMENT_MIN_AGE, _PENDING_PAYMENT_MAX_AGE
+    )
+    if not pending_payments:
+        return
+
+    semaphore = asyncio.Semaphore(_PENDING_PAYMENT_CONCURRENCY)
+
+    async def reconcile(user_id, payment_id, plan_key):
+        async with semaphore:
+            payment_status = await get_payment_status_cached(payment_id)
+        if payment_status != "approved":
+            return
+
+        selected_plan = SUBSCRIPTION_PLANS.get(plan_key)
+        if not selected_plan:
+            logger.error(f"Pagamento {payment_id} aprovado com plano desconhecido: {plan_key}")
+            return
+
+        # Se o webhook ou o /status já ativaram, activate_subscription não faz nada
+        vip_invite_link = await activate_subscription(
+            context, user_id, None, selected_plan["title"], selected_plan["duration_days"], payment_id
+        )
+        await asyncio.to_thread(delete_pending_payment, user_id, payment_id)
+        if not vip_invite_link:
+            return
+
+        try:
+            await telegram_sender.send_message(
+                context.bot, user_id, text=build_activation_message(selected_plan["title"], vip_invite_link)
+            )
+        except Exception as e:
+            logger.error(f"Erro ao notificar usuário {user_id} sobre a ativação: {e}")
+
+    logger.info(f"Conferindo {len(pending_payments)} pagamentos pendentes.")
+    await asyncio.gather(*(reconcile(*row) for row in pending_payments))
+
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
-    subscriber = get_subscriber(user_id)
+    subscriber = await asyncio.to_thread(get_subscriber, user_id)
 
     if subscriber:
         _, username, start_date, end_date, plan, status = subscriber
-        end_dt = datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S")
+        end_dt = datetime.fromisoformat(end_date)
         remaining_days = (end_dt - datetime.now()).days
 
+        if status == "active":
+            vip_invite_link = await generate_vip_invite_link(context)
+            footer = f"Você tem acesso total aos palpites VIP! Use este link de uso único para entrar: {vip_invite_link}"
+        else:
+            footer = "Sua assinatura não está ativa. Use /assinar para renovar ou adquirir um plano."
+
+        # Mensagem montada de uma vez, sem concatenações sucessivas
         message = f"**Status da sua Assinatura VIP:**\n\n"\
                   f"Plano: {plan}\n"\
                   f"Início: {start_date}\n"\
                   f"Término: {end_date}\n"\
                   f"Dias restantes: {remaining_days} dias\n"\
-                  f"Status: {status.capitalize()}\n\n"
-        if status == "active":
-            vip_invite_link = await generate_vip_invite_link(context)
-            message += f"Você tem acesso total aos palpites VIP! Use este link de uso único para entrar: {vip_invite_link}"
-        else:
-            message += "Sua assinatura não está ativa. Use /assinar para renovar ou adquirir um plano."
+                  f"Status: {status.capitalize()}\n\n"\
+                  f"{footer}"
     else:
-        payment_id = context.user_data.get("current_payment_id")
-        if payment_id:
-            payment_status = check_payment_status(payment_id)
+        pending_payment = await asyncio.to_thread(get_pending_payment, user_id)
+        if pending_payment:
+            payment_id, plan_key = pending_payment
+            payment_status = await get_payment_status_cached(payment_id)
             if payment_status == "approved":
-                selected_plan = context.user_data.get("current_plan")
+                selected_plan = SUBSCRIPTION_PLANS.get(plan_key)
                 if selected_plan:
-                    duration = timedelta(days=selected_plan["duration_days"])
-                    end_date = (datetime.now() + duration).strftime("%Y-%m-%d %H:%M:%S")
-                    add_subscriber(user_id, update.effective_user.username or update.effective_user.first_name, selected_plan["title"], end_date)
-                    vip_invite_link = await generate_vip_invite_link(context)
-                    await update.message.reply_text(
-                        f"🎉 Parabéns! Seu pagamento foi **APROVADO**!\n\n"\
-                        f"Sua assinatura **{selected_plan['title']}** está ativa.\n"\
-                        f"Acesse o canal VIP com seu link exclusivo (válido por 24h): {vip_invite_link}\n\n"\
-                        "Bem-vindo ao time Zeus Tips! ⚡"
+                    vip_invite_link = await activate_subscription(
+                        context, user_id, update.effective_user.username or update.effective_user.first_name,
+                        selected_plan["title"], selected_plan["duration_days"], str(payment_id)
                     )
+                    await asyncio.to_thread(delete_pending_payment, user_id, payment_id)
+                    if vip_invite_link:
+                        await update.effective_message.reply_text(build_activation_message(selected_plan["title"], vip_invite_link))
                     message = "Sua assinatura foi ativada!"
                 else:
                     message = "Seu pagamento foi aprovado, mas houve um erro ao ativar o plano. Entre em contato com o suporte."
@@ -616,141 +712,153 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         else:
             message = "Você não possui uma assinatura ativa. Use /assinar para adquirir um plano VIP e ter acesso a todos os palpites!"
 
-    await update.message.reply_text(message)
+    await update.effective_message.reply_text(message)
 
 async def predictions_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
-    subscriber = get_subscriber(user_id)
+    subscriber_status = await asyncio.to_thread(get_subscriber_status, user_id)
 
-    if subscriber and subscriber[5] == "active":
-        await update.message.reply_text("Como assinante VIP, você receberá os palpites completos diretamente no canal VIP. Fique atento às notificações!")
-    else:
-        today = datetime.now().strftime("%Y-%m-%d")
-        fixtures_data = get_fixtures_by_date(today)
-        preview_prediction_text = (
-            "Aqui está uma prévia dos nossos palpites (limitado para não assinantes):\n\n"\
-            "⚡ ZEUS TIPS - PRÉVIA ⚡\n"\
-            "🏆 Campeonato: Exemplo de Campeonato\n"\
-            "⚽ Jogo: Time da Casa vs Time Visitante\n"\
-            "⏰ Horário: HH:MM BRT\n"\
-            "📊 Análise: Análise resumida do jogo.\n"\
-            "🎯 Palpite: Palpite (Mercado)\n"\
-            "📈 Confiança: XX%\n"\
-            "💰 Odd sugerida: X.XX\n\n"\
-            "Para ter acesso a todos os palpites e análises completas, torne-se um membro VIP! Use /assinar."
-        )
+    if subscriber_status == "active":
+        await update.effective_message.reply_text("Como assinante VIP, você receberá os palpites completos diretamente no canal VIP. Fique atento às notificações!")
+        return
 
-        if fixtures_data:
-            fixture = fixtures_data[0]
-            match_id = fixture["fixture"]["id"]
-            championship = fixture["league"]["name"]
-            home_team_name = fixture["teams"]["home"]["name"]
-            away_team_name = fixture["teams"]["away"]["name"]
-            match_time_utc = datetime.fromisoformat(fixture["fixture"]["date"].replace("Z", "+00:00"))
-            match_time_brt = match_time_utc - timedelta(hours=3)
+    # Uma prévia por vez por usuário: repetir /palpites não dispara outra análise em paralelo
+    if context.user_data.get("preview_in_progress"):
+        await update.effective_message.reply_text("Sua prévia ainda está sendo gerada, aguarde um instante...")
+        return
+    context.user_data["preview_in_progress"] = True
+    try:
+        await send_prediction_preview(update)
+    finally:
+        context.user_data["preview_in_progress"] = False
 
-            home_team_id = fixture["teams"]["home"]["id"]
-            away_team_id = fixture["teams"]["away"]["id"]
-            league_id = fixture["league"]["id"]
-            season = fixture["league"]["season"]
+async def send_prediction_preview(update: Update) -> None:
+    """Gera a prévia de palpite (primeiro jogo do dia) para quem não é assinante."""
+    today = date.today().isoformat()
+    try:
+        fixtures_data = await get_fixtures_by_date(today)
+    except (ApiFootballError, httpx.HTTPError) as e:
+        # Sem a lista de jogos (ex.: cota da API esgotada) o usuário recebe a mensagem padrão
+        logger.error(f"Erro ao buscar jogos de hoje para a prévia: {e}")
+        fixtures_data = []
+    preview_prediction_text = _PREVIEW_PLACEHOLDER_TEXT
+
+    if fixtures_data:
+        fixture = fixtures_data[0]
+        championship = fixture["league"]["name"]
+        home_team_name = fixture["teams"]["home"]["name"]
+        away_team_name = fixture["teams"]["away"]["name"]
+        match_time_brt = format_match_time_brt(fixture["fixture"]["date"])
 
-            try:
-                home_team_stats = get_team_statistics(home_team_id, league_id, season)
-                away_team_stats = get_team_statistics(away_team_id, league_id, season)
-                h2h_stats = get_h2h_statistics(home_team_id, away_team_id)
+        home_team_id = fixture["teams"]["home"]["id"]
+        away_team_id = fixture["teams"]["away"]["id"]
+        league_id = fixture["league"]["id"]
+        season = fixture["league"]["season"]
+
+        try:
+            home_team_stats, away_team_stats, h2h_stats = await asyncio.gather(
+                get_team_statistics(home_team_id, league_id, season),
+                get_team_statistics(away_team_id, league_id, season),
+                get_h2h_statistics(home_team_id, away_team_id)
+            )
+
+            match_data = {
+                "championship": championship,
+                "home_team": home_team_name,
+                "away_team": away_team_name,
+                "match_time": match_time_brt,
+                "home_team_stats": home_team_stats,
+                "away_team_stats": away_team_stats,
+                "h2h": h2h_stats
+            }
+
+            ai_response = await analyze_and_predict(match_data)
 
-                match_data = {
+            if ai_response:
+                # Usar format_prediction_message para incluir classificação de odd e gestão de banca
+                pred_data = {
                     "championship": championship,
-                    "home_team": home_team_name,
-                    "away_team": away_team_name,
-                    "match_time": match_time_brt.strftime("%H:%M BRT"),
-                    "home_team_stats": home_team_stats,
-                    "away_team_stats": away_team_stats,
-                    "h2h": h2h_stats
+                    "team_a": home_team_name,
+                    "team_b": away_team_name,
+                    "match_time": match_time_brt,
+                    **parse_ai_response(ai_response)
                 }
+                preview_prediction_text = "\n".join((
+                    format_prediction_message(pred_data, header="⚡ ZEUS TIPS - PRÉVIA ⚡"),
+                    "Para ter acesso a todos os palpites e análises completas, torne-se um membro VIP! Use /assinar."
+                ))
+        except Exception as e:
+            logger.error(f"Erro ao gerar prévia de palpite: {e}")
 
-                ai_response = analyze_and_predict(match_data)
-
-                if ai_response:
-                    analysis = "N/A"
-                    prediction = "N/A"
-                    confidence = 0.0
-                    suggested_odd = 0.0
-                    market = "N/A"
-
-                    lines = ai_response.split("\n")
-                    for line in lines:
-                        if "Análise:" in line: analysis = line.replace("Análise:", "").strip()
-                        if "Palpite:" in line: prediction = line.replace("Palpite:", "").strip()
-                        if "Confiança:" in line: confidence = float(line.replace("Confiança:", "").replace("%", "").strip()) / 100.0
-                        if "Mercado:" in line: market = line.replace("Mercado:", "").strip()
-                        if "Odd Sugerida:" in line: suggested_odd = float(line.replace("Odd Sugerida:", "").strip())
-
-                    # Usar format_prediction_message para incluir classificação de odd e gestão de banca
-                    pred_data = {
-                        "championship": championship,
-                        "team_a": home_team_name,
-                        "team_b": away_team_name,
-                        "match_time": match_time_brt.strftime('%H:%M BRT'),
-                        "analysis": analysis,
-                        "prediction": prediction,
-                        "confidence": confidence,
-                        "suggested_odd": suggested_odd,
-                        "market": market
-                    }
-                    preview_prediction_text = format_prediction_message(pred_data, header="⚡ ZEUS TIPS - PRÉVIA ⚡")
-                    preview_prediction_text += "\nPara ter acesso a todos os palpites e análises completas, torne-se um membro VIP! Use /assinar."
-            except Exception as e:
-                logger.error(f"Erro ao gerar prévia de palpite: {e}")
-
-        await update.message.reply_text(preview_prediction_text)
+    await update.effective_message.reply_text(preview_prediction_text)
 
 # --- Funções de Automação e Admin ---
 
+# Análises de IA além do número de palpites a enviar: margem para os descartados pela confiança
+_AI_CANDIDATE_MARGIN = 2
+
+def _recent_win_rate(team_stats):
+    """Aproveitamento (vitórias) nos últimos 5 jogos do campo 'form' da API-Football; 0.5 se não houver."""
+    form = team_stats.get("form") if isinstance(team_stats, dict) else None
+    recent = (form or "")[-5:]
+    return recent.count("W") / len(recent) if recent else 0.5
+
+def _prescore(home_team_stats, away_team_stats, h2h):
+    """
+    Nota barata, calculada só com as estatísticas já buscadas, para decidir quais jogos
+    vão para a IA: favorece confrontos desequilibrados na forma recente e com histórico
+    de confrontos diretos (mais dados, palpites mais confiantes).
+    """
+    form_gap = abs(_recent_win_rate(home_team_stats) - _recent_win_rate(away_team_stats))
+    h2h_depth = min(len(h2h), 10) / 10 if isinstance(h2h, list) else 0.0
+    return form_gap + 0.5 * h2h_depth
+
 async def send_daily_predictions(context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Envia palpites diários no canal VIP.
     Inclui: Classificação de Odds (M1), Gestão de Banca (M2), Múltipla Diária (M3).
     """
     logger.info("Iniciando envio diário de palpites...")
-    vip_channel_id = await get_vip_channel_id_from_db()
+    vip_channel_id = get_vip_channel_id_from_db()
     if not vip_channel_id:
         logger.warning("VIP_CHANNEL_ID não configurado. Palpites não serão enviados.")
         return
 
-    today = datetime.now().strftime("%Y-%m-%d")
-    fixtures_data = get_fixtures_by_date(today)
+    today = date.today().isoformat()
+    try:
+        fixtures_data = await get_fixtures_by_date(today)
+    except (ApiFootballError, httpx.HTTPError) as e:
+        logger.error(f"Erro ao buscar jogos de hoje na API-Football. Palpites não serão enviados: {e}")
+        return
 
     if not fixtures_data:
         logger.info("Nenhum jogo encontrado para hoje.")
         return
 
-    football_fixtures = [f for f in fixtures_data if f["league"]["type"] == "league" or f["league"]["type"] == "cup"]
+    # Filtrar ligas/copas e separar os jogos prioritários dos demais numa única passada
+    priority_fixtures: list[dict[str, Any]] = []
+    other_fixtures: list[dict[str, Any]] = []
+    for f in fixtures_data:
+        league = f["league"]
+        if league["type"] not in _LEAGUE_TYPES:
+            continue
+        (priority_fixtures if league["id"] in PRIORITY_LEAGUE_IDS else other_fixtures).append(f)
 
-    # Separar jogos prioritários dos demais
-    priority_fixtures = [f for f in football_fixtures if f["league"]["id"] in PRIORITY_LEAGUES]
-    other_fixtures = [f for f in football_fixtures if f["league"]["id"] not in PRIORITY_LEAGUES]
-    
     # Priorizar campeonatos da lista, depois os demais
     sorted_fixtures = priority_fixtures + other_fixtures
-    logger.info(f"Jogos encontrados: {len(football_fixtures)} total, {len(priority_fixtures)} prioritários.")
+    logger.info(f"Jogos encontrados: {len(sorted_fixtures)} total, {len(priority_fixtures)} prioritários.")
 
     num_games = len(sorted_fixtures)
     predictions_to_send = 10 if num_games >= 6 else 3
-    sent_count = 0
     all_predictions = []
 
-    for fixture in sorted_fixtures:
-        if len(all_predictions) >= predictions_to_send + 5:
-            # Buscar um pouco mais do que o necessário para ter margem
-            break
-
+    async def process_fixture(fixture):
+        """Busca as estatísticas de um jogo e monta o match_data (None em caso de erro)."""
         match_id = fixture["fixture"]["id"]
         championship = fixture["league"]["name"]
         home_team_name = fixture["teams"]["home"]["name"]
         away_team_name = fixture["teams"]["away"]["name"]
-        match_time_utc = datetime.fromisoformat(fixture["fixture"]["date"].replace("Z", "+00:00"))
-        match_time_brt = match_time_utc - timedelta(hours=3)
+        match_time_brt = format_match_time_brt(fixture["fixture"]["date"])
 
         home_team_id = fixture["teams"]["home"]["id"]
         away_team_id = fixture["teams"]["away"]["id"]
@@ -758,79 +866,94 @@ async def send_daily_predictions(context: ContextTypes.DEFAULT_TYPE) -> None:
         season = fixture["league"]["season"]
 
         try:
-            home_team_stats = get_team_statistics(home_team_id, league_id, season)
-            away_team_stats = get_team_statistics(away_team_id, league_id, season)
-            h2h_stats = get_h2h_statistics(home_team_id, away_team_id)
+            # As três consultas são independentes: dispará-las juntas custa um único RTT
+            home_team_stats, away_team_stats, h2h_stats = await asyncio.gather(
+                get_team_statistics(home_team_id, league_id, season),
+                get_team_statistics(away_team_id, league_id, season),
+                get_h2h_statistics(home_team_id, away_team_id)
+            )
         except Exception as e:
             logger.error(f"Erro ao buscar estatísticas para {home_team_name} vs {away_team_name}: {e}")
-            continue
+            return None
 
         match_data = {
             "championship": championship,
             "home_team": home_team_name,
             "away_team": away_team_name,
-            "match_time": match_time_brt.strftime("%H:%M BRT"),
+            "match_time": match_time_brt,
             "home_team_stats": home_team_stats,
             "away_team_stats": away_team_stats,
             "h2h": h2h_stats
         }
+        return match_id, match_data
 
-        ai_response = analyze_and_predict(match_data)
+    # Buscar um pouco mais do que o necessário para ter margem, no máximo
+    # DAILY_FIXTURE_CONCURRENCY jogos por vez (o rate limiter da API-Football continua
+    # controlando o ritmo). O timeout conta só o trabalho do jogo, não a espera na fila.
+    semaphore = asyncio.Semaphore(DAILY_FIXTURE_CONCURRENCY)
 
-        if ai_response:
-            analysis = "N/A"
-            prediction = "N/A"
-            confidence = 0.0
-            suggested_odd = 0.0
-            market = "N/A"
+    async def bounded_process_fixture(fixture):
+        async with semaphore:
+            return await asyncio.wait_for(process_fixture(fixture), timeout=DAILY_FIXTURE_TIMEOUT)
 
-            try:
-                lines = ai_response.split("\n")
-                for line in lines:
-                    if "Análise:" in line: analysis = line.replace("Análise:", "").strip()
-                    if "Palpite:" in line: prediction = line.replace("Palpite:", "").strip()
-                    if "Confiança:" in line: confidence = float(line.replace("Confiança:", "").replace("%", "").strip()) / 100.0
-                    if "Mercado:" in line: market = line.replace("Mercado:", "").strip()
-                    if "Odd Sugerida:" in line: suggested_odd = float(line.replace("Odd Sugerida:", "").strip())
-            except Exception as e:
-                logger.error(f"Erro ao parsear resposta da IA para o jogo {home_team_name} vs {away_team_name}: {e}")
-                continue
+    fixture_results = await asyncio.gather(
+        *(bounded_process_fixture(f) for f in sorted_fixtures[:predictions_to_send + 5]),
+        return_exceptions=True
+    )
+    candidates = []
+    for fixture_result in fixture_results:
+        if isinstance(fixture_result, asyncio.TimeoutError):
+            logger.warning(f"Jogo ignorado nos palpites diários: estatísticas não chegaram em {DAILY_FIXTURE_TIMEOUT}s.")
+        elif isinstance(fixture_result, Exception):
+            logger.error(f"Erro ao processar jogo para os palpites diários: {fixture_result}")
+        elif fixture_result:
+            candidates.append(fixture_result)
+
+    # Só os jogos mais promissores pela nota barata vão para a IA (a chamada mais cara);
+    # sort estável: no empate, os campeonatos prioritários continuam na frente
+    candidates.sort(
+        key=lambda c: _prescore(c[1]["home_team_stats"], c[1]["away_team_stats"], c[1]["h2h"]),
+        reverse=True
+    )
+    del candidates[predictions_to_send + _AI_CANDIDATE_MARGIN:]
 
-            all_predictions.append({
-                "match_id": match_id,
-                "championship": championship,
-                "team_a": home_team_name,
-                "team_b": away_team_name,
-                "match_time": match_time_brt.strftime("%H:%M BRT"),
-                "analysis": analysis,
-                "prediction": prediction,
-                "confidence": confidence,
-                "suggested_odd": suggested_odd,
-                "market": market
-            })
-
-    # Ordenar por confiança (maior primeiro)
-    all_predictions.sort(key=lambda x: x["confidence"], reverse=True)
-
-    # Enviar palpites individuais com classificação de odd e gestão de banca
-    for i, pred in enumerate(all_predictions):
-        if i >= predictions_to_send:
-            break
-
-        # MELHORIA 1 & 2: Usar format_prediction_message
-        message_text = format_prediction_message(pred)
+    # Analisar todos os jogos selecionados de uma vez (uma requisição por lote)
+    ai_results = await analyze_and_predict_batch([match_data for _, match_data in candidates])
 
-        try:
-            await context.bot.send_message(chat_id=vip_channel_id, text=message_text)
-            add_prediction_history(
+    for (match_id, match_data), ai_result in zip(candidates, ai_results):
+        if not ai_result:
+            logger.warning(f"Sem análise da IA para o jogo {match_data['home_team']} vs {match_data['away_team']}.")
+            continue
+
+        all_predictions.append({
+            "match_id": match_id,
+            "championship": match_data["championship"],
+            "team_a": match_data["home_team"],
+            "team_b": match_data["away_team"],
+            "match_time": match_data["match_time"],
+            **ai_result
+        })
+
+    # Os de maior confiança primeiro, em O(M log K); all_predictions fica intacta para a múltipla
+    to_send = heapq.nlargest(predictions_to_send, all_predictions, key=itemgetter("confidence"))
+
+    # Enviar palpites individuais com classificação de odd e gestão de banca,
+    # agrupados em poucas mensagens (MELHORIA 1 & 2: format_prediction_message)
+    delivered = await flush_batch(
+        context.bot, vip_channel_id, [format_prediction_message(pred) for pred in to_send]
+    )
+    if delivered:
+        # Salvar no histórico só os palpites que foram entregues, numa única transação
+        await asyncio.to_thread(add_prediction_history_bulk, [
+            (
                 pred["match_id"], pred["championship"], pred["team_a"], pred["team_b"],
                 pred["match_time"], pred["analysis"], pred["prediction"], pred["confidence"],
                 pred["suggested_odd"]
             )
-            sent_count += 1
-            logger.info(f"Palpite enviado para {pred['team_a']} vs {pred['team_b']}")
-        except Exception as e:
-            logger.error(f"Erro ao enviar palpite para o canal VIP: {e}")
+            for pred in (to_send[i] for i in delivered)
+        ])
+    sent_count = len(delivered)
+    logger.info(f"{sent_count} de {len(to_send)} palpites enviados para o canal VIP.")
 
     # MELHORIA 3: Enviar a múltipla diária após os palpites individuais
     if len(all_predictions) >= 3:
@@ -838,7 +961,7 @@ async def send_daily_predictions(context: ContextTypes.DEFAULT_TYPE) -> None:
         if multiple_message:
             try:
                 await asyncio.sleep(2)  # Pequeno delay antes de enviar a múltipla
-                await context.bot.send_message(chat_id=vip_channel_id, text=multiple_message)
+                await telegram_sender.send_message(context.bot, vip_channel_id, text=multiple_message)
                 logger.info("Múltipla diária enviada com sucesso.")
             except Exception as e:
                 logger.error(f"Erro ao enviar múltipla diária: {e}")
@@ -854,27 +977,37 @@ async def send_live_predictions(context: ContextTypes.DEFAULT_TYPE) -> None:
     Inclui: Classificação de Odds (M1), Gestão de Banca (M2).
     """
     logger.info("Iniciando envio de palpites ao vivo...")
-    vip_channel_id = await get_vip_channel_id_from_db()
+    vip_channel_id = get_vip_channel_id_from_db()
     if not vip_channel_id:
         logger.warning("VIP_CHANNEL_ID não configurado. Palpites ao vivo não serão enviados.")
         return
 
-    live_fixtures = get_live_fixtures()
+    live_fixtures = await get_live_fixtures()
     if not live_fixtures:
         logger.info("Nenhum jogo ao vivo encontrado no momento.")
         return
 
-    # Filtrar apenas jogos de campeonatos prioritários
-    priority_live = [f for f in live_fixtures if f["league"]["id"] in PRIORITY_LEAGUES]
-    
+    # Máximo 5 palpites ao vivo por vez: só os jogos de campeonatos prioritários ainda em
+    # andamento (intervalo/finalizados não ocupam vaga), e a filtragem para no quinto
+    priority_live = list(itertools.islice(
+        (
+            f for f in live_fixtures
+            if f["league"]["id"] in PRIORITY_LEAGUE_IDS
+            and f["fixture"]["status"]["short"] not in _LIVE_SKIP_STATUSES
+        ),
+        5
+    ))
+
     if not priority_live:
-        logger.info("Nenhum jogo ao vivo de campeonatos prioritários encontrado.")
+        logger.info("Nenhum jogo ao vivo de campeonatos prioritários em andamento.")
         return
 
-    logger.info(f"Jogos ao vivo prioritários encontrados: {len(priority_live)}")
-    sent_count = 0
+    logger.info(f"Jogos ao vivo prioritários selecionados: {len(priority_live)}")
+    # Os jogos são independentes: processar em paralelo, com no máximo 3 análises ao mesmo tempo
+    semaphore = asyncio.Semaphore(3)
 
-    for fixture in priority_live[:5]:  # Máximo 5 palpites ao vivo por vez
+    async def handle_fixture(fixture):
+        """Gera o palpite ao vivo de um jogo; retorna (mensagem, linha do histórico) ou None."""
         match_id = fixture["fixture"]["id"]
         championship = fixture["league"]["name"]
         home_team_name = fixture["teams"]["home"]["name"]
@@ -882,177 +1015,155 @@ async def send_live_predictions(context: ContextTypes.DEFAULT_TYPE) -> None:
         home_goals = fixture["goals"]["home"] or 0
         away_goals = fixture["goals"]["away"] or 0
         elapsed = fixture["fixture"]["status"]["elapsed"] or 0
-        status_short = fixture["fixture"]["status"]["short"]
-
-        # Pular jogos no intervalo ou já finalizados
-        if status_short in ["HT", "FT", "AET", "PEN", "PST", "CANC", "ABD"]:
-            continue
 
         home_team_id = fixture["teams"]["home"]["id"]
         away_team_id = fixture["teams"]["away"]["id"]
-        league_id = fixture["league"]["id"]
-        season = fixture["league"]["season"]
-
-        try:
-            h2h_stats = get_h2h_statistics(home_team_id, away_team_id)
-        except Exception as e:
-            logger.error(f"Erro ao buscar H2H para {home_team_name} vs {away_team_name}: {e}")
-            h2h_stats = []
-
-        match_data = {
-            "championship": championship,
-            "home_team": home_team_name,
-            "away_team": away_team_name,
-            "match_time": f"AO VIVO - {elapsed}'",
-            "live_score": f"{home_goals} x {away_goals}",
-            "home_team_stats": {"live": True, "goals": home_goals},
-            "away_team_stats": {"live": True, "goals": away_goals},
-            "h2h": h2h_stats
-        }
-
-        ai_response = analyze_and_predict(match_data)
-
-        if ai_response:
-            analysis = "N/A"
-            prediction = "N/A"
-            confidence = 0.0
-            suggested_odd = 0.0
-            market = "N/A"
 
+        async with semaphore:
             try:
-                lines = ai_response.split("\n")
-                for line in lines:
-                    if "Análise:" in line: analysis = line.replace("Análise:", "").strip()
-                    if "Palpite:" in line: prediction = line.replace("Palpite:", "").strip()
-                    if "Confiança:" in line: confidence = float(line.replace("Confiança:", "").replace("%", "").strip()) / 100.0
-                    if "Mercado:" in line: market = line.replace("Mercado:", "").strip()
-                    if "Odd Sugerida:" in line: suggested_odd = float(line.replace("Odd Sugerida:", "").strip())
+                h2h_stats = await get_h2h_statistics(home_team_id, away_team_id)
             except Exception as e:
-                logger.error(f"Erro ao parsear resposta da IA (ao vivo) para {home_team_name} vs {away_team_name}: {e}")
-                continue
+                logger.error(f"Erro ao buscar H2H para {home_team_name} vs {away_team_name}: {e}")
+                h2h_stats = []
 
-            # MELHORIA 1 & 2: Usar format_live_prediction_message
-            pred_data = {
+            match_data = {
                 "championship": championship,
-                "team_a": home_team_name,
-                "team_b": away_team_name,
-                "analysis": analysis,
-                "prediction": prediction,
-                "confidence": confidence,
-                "suggested_odd": suggested_odd,
-                "market": market
+                "home_team": home_team_name,
+                "away_team": away_team_name,
+                "match_time": f"AO VIVO - {elapsed}'",
+                "live_score": f"{home_goals} x {away_goals}",
+                "home_team_stats": {"live": True, "goals": home_goals},
+                "away_team_stats": {"live": True, "goals": away_goals},
+                "h2h": h2h_stats
             }
-            message_text = format_live_prediction_message(pred_data, home_goals, away_goals, elapsed)
 
-            try:
-                await context.bot.send_message(chat_id=vip_channel_id, text=message_text)
-                # Salvar palpite ao vivo no histórico também
-                add_prediction_history(
-                    match_id, championship, home_team_name, away_team_name,
-                    f"AO VIVO - {elapsed}'", analysis, prediction, confidence,
-                    suggested_odd
-                )
-                sent_count += 1
-                logger.info(f"Palpite ao vivo enviado: {home_team_name} vs {away_team_name}")
-            except Exception as e:
-                logger.error(f"Erro ao enviar palpite ao vivo: {e}")
+            ai_response = await analyze_and_predict(match_data, min_confidence=AI_MIN_CONFIDENCE)
+
+        if not ai_response:
+            return None
+
+        try:
+            parsed = parse_ai_response(ai_response)
+        except ValueError as e:
+            logger.error(f"Erro ao parsear resposta da IA (ao vivo) para {home_team_name} vs {away_team_name}: {e}")
+            return None
 
-        await asyncio.sleep(1)
+        # MELHORIA 1 & 2: Usar format_live_prediction_message
+        pred_data = {
+            "championship": championship,
+            "team_a": home_team_name,
+            "team_b": away_team_name,
+            **parsed
+        }
+        message_text = format_live_prediction_message(pred_data, home_goals, away_goals, elapsed)
+        history_row = (
+            match_id, championship, home_team_name, away_team_name,
+            f"AO VIVO - {elapsed}'", parsed["analysis"], parsed["prediction"], parsed["confidence"],
+            parsed["suggested_odd"]
+        )
+        return message_text, history_row
+
+    live_messages = []
+    live_rows = []
+    outcomes = await asyncio.gather(
+        *(asyncio.wait_for(handle_fixture(f), timeout=LIVE_FIXTURE_TIMEOUT) for f in priority_live),
+        return_exceptions=True
+    )
+    for outcome in outcomes:
+        if isinstance(outcome, asyncio.TimeoutError):
+            logger.warning(f"Palpite ao vivo ignorado: o jogo não foi processado em {LIVE_FIXTURE_TIMEOUT}s.")
+        elif isinstance(outcome, Exception):
+            logger.error(f"Erro ao processar jogo ao vivo: {outcome}")
+        elif outcome:
+            live_messages.append(outcome[0])
+            live_rows.append(outcome[1])
+
+    # Enviar os palpites agrupados e salvar no histórico só os que foram entregues
+    delivered = await flush_batch(context.bot, vip_channel_id, live_messages)
+    if delivered:
+        await asyncio.to_thread(add_prediction_history_bulk, [live_rows[i] for i in delivered])
+    sent_count = len(delivered)
 
     logger.info(f"Envio de palpites ao vivo concluído. {sent_count} palpites enviados.")
 
+def admin_only(handler):
+    """Restringe o comando ao ADMIN_USER_ID; os demais recebem a mensagem de permissão negada."""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if update.effective_user.id != ADMIN_USER_ID:
+            await update.effective_message.reply_text("Você não tem permissão para usar este comando.")
+            return
+        await handler(update, context)
+    return wrapper
+
+@admin_only
 async def admin_force_send_predictions_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.effective_user.id != ADMIN_USER_ID:
-        await update.message.reply_text("Você não tem permissão para usar este comando.")
-        return
-    await update.message.reply_text("Forçando o envio de palpites agora...")
+    await update.effective_message.reply_text("Forçando o envio de palpites agora...")
     await send_daily_predictions(context)
-    await update.message.reply_text("Envio de palpites concluído (verifique os logs para detalhes).")
+    await update.effective_message.reply_text("Envio de palpites concluído (verifique os logs para detalhes).")
 
+@admin_only
 async def admin_force_live_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.effective_user.id != ADMIN_USER_ID:
-        await update.message.reply_text("Você não tem permissão para usar este comando.")
-        return
-    await update.message.reply_text("Buscando jogos ao vivo agora...")
+    await update.effective_message.reply_text("Buscando jogos ao vivo agora...")
     await send_live_predictions(context)
-    await update.message.reply_text("Envio de palpites ao vivo concluído (verifique os logs para detalhes).")
+    await update.effective_message.reply_text("Envio de palpites ao vivo concluído (verifique os logs para detalhes).")
 
+@admin_only
 async def admin_force_check_results_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Comando admin para forçar verificação de resultados."""
-    if update.effective_user.id != ADMIN_USER_ID:
-        await update.message.reply_text("Você não tem permissão para usar este comando.")
-        return
-    await update.message.reply_text("Forçando verificação de resultados...")
+    await update.effective_message.reply_text("Forçando verificação de resultados...")
     await check_results(context)
-    await update.message.reply_text("Verificação de resultados concluída (verifique os logs para detalhes).")
+    await update.effective_message.reply_text("Verificação de resultados concluída (verifique os logs para detalhes).")
 
+@admin_only
 async def admin_force_summary_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Comando admin para forçar envio do resumo diário."""
-    if update.effective_user.id != ADMIN_USER_ID:
-        await update.message.reply_text("Você não tem permissão para usar este comando.")
-        return
-    await update.message.reply_text("Forçando envio do resumo diário...")
+    await update.effective_message.reply_text("Forçando envio do resumo diário...")
     await send_daily_summary(context)
-    await update.message.reply_text("Resumo diário enviado (verifique os logs para detalhes).")
+    await update.effective_message.reply_text("Resumo diário enviado (verifique os logs para detalhes).")
 
+@admin_only
 async def admin_games_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.effective_user.id != ADMIN_USER_ID:
-        await update.message.reply_text("Você não tem permissão para usar este comando.")
-        return
-
     if not context.args or len(context.args) != 1:
-        await update.message.reply_text("Uso: /admin_jogos YYYY-MM-DD")
+        await update.effective_message.reply_text("Uso: /admin_jogos YYYY-MM-DD")
         return
 
     date_str = context.args[0]
     try:
         datetime.strptime(date_str, "%Y-%m-%d")
     except ValueError:
-        await update.message.reply_text("Formato de data inválido. Use YYYY-MM-DD.")
+        await update.effective_message.reply_text("Formato de data inválido. Use YYYY-MM-DD.")
         return
 
-    fixtures = get_fixtures_by_date(date_str)
+    try:
+        fixtures = await get_fixtures_by_date(date_str)
+    except (ApiFootballError, httpx.HTTPError) as e:
+        logger.error(f"Erro ao buscar jogos de {date_str} na API-Football: {e}")
+        await update.effective_message.reply_text(f"Erro ao buscar jogos na API-Football: {e}")
+        return
 
     if fixtures:
-        message = f"Jogos encontrados para {date_str}:\n\n"
+        parts = [f"Jogos encontrados para {date_str}:"]
         for fixture in fixtures:
             home_team = fixture["teams"]["home"]["name"]
             away_team = fixture["teams"]["away"]["name"]
             championship = fixture["league"]["name"]
-            match_time_utc = datetime.fromisoformat(fixture["fixture"]["date"].replace("Z", "+00:00"))
-            match_time_brt = match_time_utc - timedelta(hours=3)
-            message += f"🏆 {championship}\n⚽ {home_team} vs {away_team}\n⏰ {match_time_brt.strftime('%H:%M BRT')}\n\n"
-        await update.message.reply_text(message)
+            match_time_brt = format_match_time_brt(fixture["fixture"]["date"])
+            parts.append(f"🏆 {championship}\n⚽ {home_team} vs {away_team}\n⏰ {match_time_brt}")
+        # Datas cheias passam do limite de uma mensagem: divide em várias, na ordem
+        await flush_batch(context.bot, update.effective_chat.id, parts, separator="\n\n")
     else:
-        await update.message.reply_text(f"Nenhum jogo encontrado para {date_str}.")
+        await update.effective_message.reply_text(f"Nenhum jogo encontrado para {date_str}.")
 
+@admin_only
 async def admin_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Estatísticas do bot com informações de GREEN/RED (atualizado).
     """
-    if update.effective_user.id != ADMIN_USER_ID:
-        await update.message.reply_text("Você não tem permissão para usar este comando.")
-        return
-
-    conn = sqlite3.connect("zeus_tips.db")
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT COUNT(*) FROM subscribers WHERE status = 'active'")
-    active_subscribers = cursor.fetchone()[0]
-
-    cursor.execute("SELECT COUNT(*) FROM predictions_history")
-    total_predictions = cursor.fetchone()[0]
-
-    cursor.execute("SELECT COUNT(*) FROM predictions_history WHERE result = 'green'")
-    total_greens = cursor.fetchone()[0]
-
-    cursor.execute("SELECT COUNT(*) FROM predictions_history WHERE result = 'red'")
-    total_reds = cursor.fetchone()[0]
-
-    cursor.execute("SELECT COUNT(*) FROM predictions_history WHERE result = 'pending'")
-    total_pending = cursor.fetchone()[0]
-
-    conn.close()
+    # Consultas no SQLite fora do event loop, para não travar os outros handlers
+    active_subscribers, total_predictions, total_greens, total_reds, total_pending = (
+        await asyncio.to_thread(get_admin_stats)
+    )
 
     resolved = total_greens + total_reds
     win_rate = (total_greens / resolved * 100) if resolved > 0 else 0
@@ -1065,15 +1176,12 @@ async def admin_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE
               f"⏳ Pendentes: {total_pending}\n"\
               f"📊 Taxa de Acerto: {win_rate:.1f}%\n"
 
-    await update.message.reply_text(message)
+    await update.effective_message.reply_text(message)
 
+@admin_only
 async def admin_setchannel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.effective_user.id != ADMIN_USER_ID:
-        await update.message.reply_text("Você não tem permissão para usar este comando.")
-        return
-
     if not context.args or len(context.args) != 1:
-        await update.message.reply_text(
+        await update.effective_message.reply_text(
             "Uso: /admin_setchannel [ID_numérico_do_canal]\n\n"\
             "**Como obter o ID numérico:**\n"\
             "1. Adicione o bot @userinfobot ao seu canal como administrador.\n"\
@@ -1087,81 +1195,317 @@ async def admin_setchannel_command(update: Update, context: ContextTypes.DEFAULT
         # Valida se é um ID numérico de canal/supergrupo
         if channel_input.startswith('-100') and channel_input[1:].isdigit():
             vip_channel_id = int(channel_input)
-            set_setting("VIP_CHANNEL_ID", str(vip_channel_id))
-            await update.message.reply_text(f"Canal VIP configurado com sucesso para o ID: `{vip_channel_id}`")
+            await asyncio.to_thread(set_setting, "VIP_CHANNEL_ID", str(vip_channel_id))
+            await update.effective_message.reply_text(f"Canal VIP configurado com sucesso para o ID: `{vip_channel_id}`")
         else:
             raise ValueError("ID de canal inválido")
     except (ValueError, TypeError):
-        await update.message.reply_text(
+        await update.effective_message.reply_text(
             "Formato de ID de canal inválido. O ID deve ser um número inteiro, geralmente começando com -100. "\
             "Siga as instruções em /admin_setchannel para obter o ID correto."
         )
 
+_CHANNEL_MEMBER_STATUSES = frozenset({"member", "administrator", "creator"})
+# O Telegram trata until_date com menos de 30 s como banimento permanente
+_VIP_BAN_DURATION = timedelta(seconds=35)
+
+async def get_vip_member_cache(context: ContextTypes.DEFAULT_TYPE, vip_channel_id):
+    """
+    Retorna o cache {user_id: status} dos usuários do canal VIP, carregado do banco
+    (numa thread) na primeira chamada ou quando o canal configurado muda, e depois
+    mantido pelos updates chat_member.
+    """
+    cache = context.bot_data.get("vip_members")
+    if cache is None or cache["channel_id"] != vip_channel_id:
+        statuses = await asyncio.to_thread(get_vip_member_statuses, vip_channel_id)
+        # Outra task pode ter carregado o cache durante a leitura: mantém o que já está em uso
+        cache = context.bot_data.get("vip_members")
+        if cache is None or cache["channel_id"] != vip_channel_id:
+            cache = {"channel_id": vip_channel_id, "statuses": statuses}
+            context.bot_data["vip_members"] = cache
+    return cache["statuses"]
+
+async def record_vip_member_status(context: ContextTypes.DEFAULT_TYPE, vip_channel_id, user_id, status):
+    member_statuses = await get_vip_member_cache(context, vip_channel_id)
+    member_statuses[user_id] = status
+    await asyncio.to_thread(set_vip_member_status, vip_channel_id, user_id, status)
+
+async def vip_chat_member_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Atualiza o cache de membros do canal VIP a cada entrada/saída (update chat_member)."""
+    chat_member_update = update.chat_member
+    vip_channel_id = get_vip_channel_id_from_db()
+    if not chat_member_update or chat_member_update.chat.id != vip_channel_id:
+        return
+
+    new_member = chat_member_update.new_chat_member
+    await record_vip_member_status(context, vip_channel_id, new_member.user.id, new_member.status)
+    logger.debug("PROTEÇÃO 2: Usuário %s agora está '%s' no canal VIP.", new_member.user.id, new_member.status)
+
 async def check_vip_members(context: ContextTypes.DEFAULT_TYPE):
     logger.info("PROTEÇÃO 2: Iniciando verificação periódica de membros no canal VIP...")
-    vip_channel_id = await get_vip_channel_id_from_db()
+    vip_channel_id = get_vip_channel_id_from_db()
     if not vip_channel_id:
         logger.error("PROTEÇÃO 2: Verificação de membros abortada. VIP_CHANNEL_ID numérico não configurado.")
         return
 
-    all_subscribers = get_all_subscribers()
-    active_subscriber_ids = {sub[0] for sub in all_subscribers if sub[1] == 'active'}
-
-    for user_id, db_status in all_subscribers:
-        # Nunca remover o admin do bot
-        if user_id == ADMIN_USER_ID:
-            continue
+    active_subscriber_ids, inactive_subscriber_ids = await asyncio.to_thread(get_subscriber_ids_by_activity)
+    member_statuses = await get_vip_member_cache(context, vip_channel_id)
 
-        try:
-            chat_member = await context.bot.get_chat_member(chat_id=vip_channel_id, user_id=user_id)
-            is_in_channel = chat_member.status in ["member", "administrator", "creator"]
+    # Só assinantes conhecidos com o plano vencido (mesmo critério da verificação original):
+    # membros do canal que nunca assinaram pelo bot não são removidos
+    to_remove = {
+        user_id for user_id, status in member_statuses.items()
+        if status in _CHANNEL_MEMBER_STATUSES and user_id in inactive_subscriber_ids
+    }
+    # Assinantes inativos cuja situação no canal ainda não é conhecida: consulta pontual
+    to_lookup = inactive_subscriber_ids - member_statuses.keys()
+
+    # Verificações em paralelo, sem passar do limite global da Bot API (~30 req/s)
+    semaphore = asyncio.Semaphore(25)
+    # Status descobertos nesta verificação: o cache é atualizado na hora e o banco
+    # recebe todos de uma vez no final, numa única transação
+    status_updates = []
+
+    def remember_status(user_id, status):
+        member_statuses[user_id] = status
+        status_updates.append((vip_channel_id, user_id, status))
+
+    async def remove_member(user_id, channel_status):
+        logger.info("PROTEÇÃO 2: Removendo usuário %s do canal VIP. Status no Canal: '%s'.", user_id, channel_status)
+        # Banimento temporário: expira sozinho e permite reentrada futura, sem a chamada de unban
+        async with _telegram_api_limiter:
+            await context.bot.ban_chat_member(
+                chat_id=vip_channel_id,
+                user_id=user_id,
+                until_date=datetime.now(timezone.utc) + _VIP_BAN_DURATION
+            )
+        remember_status(user_id, "kicked")
+        logger.info("PROTEÇÃO 2: Usuário %s removido com banimento temporário para permitir reentrada futura.", user_id)
 
-            # Cenário: Usuário está no canal, mas não tem assinatura ativa no DB
-            if is_in_channel and user_id not in active_subscriber_ids:
-                logger.info(f"PROTEÇÃO 2: Removendo usuário {user_id} do canal VIP. Status no DB: '{db_status}', Status no Canal: '{chat_member.status}'.")
-                await context.bot.ban_chat_member(chat_id=vip_channel_id, user_id=user_id)
-                await context.bot.unban_chat_member(chat_id=vip_channel_id, user_id=user_id)
-                logger.info(f"PROTEÇÃO 2: Usuário {user_id} banido e desbanido para permitir reentrada futura.")
+    async def check_member(user_id, lookup):
+        async with semaphore:
+            try:
+                if lookup:
+                    async with _telegram_api_limiter:
+                        chat_member = await context.bot.get_chat_member(chat_id=vip_channel_id, user_id=user_id)
+                    remember_status(user_id, chat_member.status)
+                    if chat_member.status not in _CHANNEL_MEMBER_STATUSES:
+                        return
+                await remove_member(user_id, member_statuses.get(user_id))
 
-        except Exception as e:
-            # Ignora erros de "user not found", que são comuns para usuários que saíram
-            if "user not found" in str(e).lower():
-                logger.debug(f"PROTEÇÃO 2: Usuário {user_id} não encontrado no canal VIP (provavelmente já saiu).")
-            else:
-                logger.error(f"PROTEÇÃO 2: Erro ao verificar/remover membro {user_id} do canal {vip_channel_id}: {e}")
-        
-        await asyncio.sleep(1)
+            except Exception as e:
+                # Ignora erros de "user not found", que são comuns para usuários que saíram
+                if "user not found" in str(e).lower():
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("PROTEÇÃO 2: Usuário %s não encontrado no canal VIP (provavelmente já saiu).", user_id)
+                else:
+                    logger.error("PROTEÇÃO 2: Erro ao verificar/remover membro %s do canal %s: %s", user_id, vip_channel_id, e)
+
+    # Nunca remover o admin do bot; assinantes ativos não geram nenhuma chamada à Bot API
+    excluded = active_subscriber_ids | {ADMIN_USER_ID}
+    to_remove -= excluded
+    to_lookup -= excluded
+    logger.info("PROTEÇÃO 2: %d remoções pelo cache e %d consultas ao Telegram.", len(to_remove), len(to_lookup))
+    if to_remove or to_lookup:
+        await asyncio.gather(
+            *(check_member(user_id, False) for user_id in to_remove),
+            *(check_member(user_id, True) for user_id in to_lookup),
+            return_exceptions=True
+        )
+        await asyncio.to_thread(set_vip_member_statuses, status_updates)
 
     logger.info("PROTEÇÃO 2: Verificação de membros do canal VIP concluída.")
 
+async def run_db_maintenance(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Checkpoint do WAL e vacuum incremental do SQLite, em horário de pouco uso."""
+    logger.info("Iniciando manutenção semanal do banco de dados...")
+    try:
+        await asyncio.to_thread(run_maintenance)
+    except Exception as e:
+        logger.error(f"Erro na manutenção do banco de dados: {e}")
+        return
+    logger.info("Manutenção do banco de dados concluída.")
+
+# --- Webhook do Mercado Pago ---
+
+async def process_payment_notification(application: Application, payment_id: str) -> None:
+    """
+    Consulta o pagamento notificado no Mercado Pago (fonte da verdade, o corpo da
+    notificação não é confiável) e ativa a assinatura quando o status é 'approved'.
+    """
+    payment = await asyncio.to_thread(get_payment, payment_id)
+    if not payment:
+        return
+
+    status = payment.get("status")
+    logger.info(f"Webhook: pagamento {payment_id} com status '{status}'.")
+    if status != "approved":
+        return
+
+    metadata = payment.get("metadata") or {}
+    try:
+        user_id = int(metadata["user_id"])
+        duration_days = int(metadata.get("duration_days", 30))
+    except (KeyError, TypeError, ValueError):
+        logger.error(f"Webhook: pagamento {payment_id} aprovado sem metadata de usuário/plano válida: {metadata}")
+        return
+    plan_title = metadata.get("plan_title") or "Assinatura Zeus Tips"
+
+    vip_invite_link = await activate_subscription(
+        application, user_id, metadata.get("username") or None, plan_title, duration_days, payment_id
+    )
+    if not vip_invite_link:
+        return
+
+    try:
+        await telegram_sender.send_message(
+            application.bot, user_id, text=build_activation_message(plan_title, vip_invite_link)
+        )
+    except Exception as e:
+        logger.error(f"Webhook: erro ao notificar usuário {user_id} sobre a ativação: {e}")
+
+def verify_mercadopago_signature(request: web.Request, data_id: str) -> bool:
+    """
+    Confere o header x-signature ("ts=...,v1=...") de uma notificação do Mercado Pago:
+    v1 é o HMAC-SHA256, com MERCADOPAGO_WEBHOOK_SECRET, do manifesto
+    "id:<data.id>;request-id:<x-request-id>;ts:<ts>;".
+    """
+    parts = dict(
+        part.strip().split("=", 1) for part in request.headers.get("x-signature", "").split(",") if "=" in part
+    )
+    ts, v1 = parts.get("ts"), parts.get("v1")
+    if not MERCADOPAGO_WEBHOOK_SECRET or not ts or not v1:
+        return False
+
+    manifest = f"id:{data_id.lower()};"
+    request_id = request.headers.get("x-request-id")
+    if request_id:
+        manifest += f"request-id:{request_id};"
+    manifest += f"ts:{ts};"
+    expected = hmac.new(MERCADOPAGO_WEBHOOK_SECRET.encode(), manifest.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, v1)
+
+async def mercadopago_webhook_handler(request: web.Request) -> web.Response:
+    """
+    Recebe as notificações de pagamento do Mercado Pago (webhook e IPN legado).
+    Responde 200 imediatamente e processa a notificação em segundo plano.
+    Com MERCADOPAGO_WEBHOOK_SECRET configurada, notificações sem assinatura válida são
+    recusadas (401) e as assinadas com id próprio passam pela deduplicação em
+    payment_events. Sem a chave (deploy sem assinatura), toda notificação gera uma
+    consulta ao Mercado Pago, que é a fonte da verdade, e a ativação é idempotente.
+    """
+    try:
+        body = await request.json()
+    except Exception:
+        body = {}
+
+    topic = body.get("type") or request.query.get("type") or request.query.get("topic")
+    payment_id = (body.get("data") or {}).get("id") or request.query.get("data.id") or request.query.get("id")
+
+    if topic == "payment" and payment_id:
+        payment_id = str(payment_id)
+        verified = bool(MERCADOPAGO_WEBHOOK_SECRET) and verify_mercadopago_signature(
+            request, request.query.get("data.id") or payment_id
+        )
+        if MERCADOPAGO_WEBHOOK_SECRET and not verified:
+            logger.warning(f"Webhook: notificação do pagamento {payment_id} sem assinatura válida. Ignorando.")
+            return web.Response(status=401)
+
+        # Cada notificação assinada tem um id próprio; um mesmo pagamento recebe várias
+        # (criação, aprovação...). Ids forjados nunca chegam a payment_events.
+        notification_id = body.get("id")
+        if verified and notification_id:
+            event = f"{body.get('action') or topic}:{notification_id}"
+            if not await asyncio.to_thread(register_payment_event, payment_id, event):
+                return web.Response(status=200)
+
+        application = request.app["application"]
+        application.create_task(process_payment_notification(application, payment_id))
+
+    return web.Response(status=200)
+
+async def telegram_webhook_handler(request: web.Request) -> web.Response:
+    """Recebe os updates do Telegram (modo webhook) e os entrega à fila da Application."""
+    if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != TELEGRAM_WEBHOOK_SECRET:
+        return web.Response(status=403)
+
+    application = request.app["application"]
+    try:
+        update = Update.de_json(await request.json(), application.bot)
+    except Exception as e:
+        logger.error(f"Update inválido recebido no webhook do Telegram: {e}")
+        return web.Response(status=400)
+
+    await application.update_queue.put(update)
+    return web.Response(status=200)
+
+async def start_webhook_server(application: Application) -> None:
+    """
+    Sobe o servidor HTTP dos webhooks: o do Mercado Pago, se MERCADOPAGO_WEBHOOK_URL estiver
+    configurada, e o do Telegram, se TELEGRAM_WEBHOOK_URL estiver configurada.
+    """
+    if not MERCADOPAGO_WEBHOOK_URL:
+        logger.info("MERCADOPAGO_WEBHOOK_URL não configurada. Confirmação de pagamento apenas via /status.")
+    if not MERCADOPAGO_WEBHOOK_URL and not TELEGRAM_WEBHOOK_URL:
+        return
+
+    web_app = web.Application()
+    web_app["application"] = application
+    if MERCADOPAGO_WEBHOOK_URL:
+        webhook_path = urlparse(MERCADOPAGO_WEBHOOK_URL).path or "/"
+        web_app.router.add_post(webhook_path, mercadopago_webhook_handler)
+        logger.info(f"Webhook do Mercado Pago escutando em 0.0.0.0:{WEBHOOK_PORT}{webhook_path}.")
+    if TELEGRAM_WEBHOOK_URL:
+        telegram_path = urlparse(TELEGRAM_WEBHOOK_URL).path or "/"
+        web_app.router.add_post(telegram_path, telegram_webhook_handler)
+        logger.info(f"Webhook do Telegram escutando em 0.0.0.0:{WEBHOOK_PORT}{telegram_path}.")
+
+    runner = web.AppRunner(web_app)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", WEBHOOK_PORT).start()
+    application.bot_data["webhook_runner"] = runner
+
 # --- Agendamento de Tarefas com Job Queue ---
 
+# Opções do APScheduler para todos os jobs: uma execução atrasada (bot ocupado ou reiniciando)
+# ainda roda dentro de 5 min, execuções acumuladas viram uma só e o mesmo job nunca roda em dobro
+_JOB_KWARGS = {"misfire_grace_time": 300, "coalesce": True, "max_instances": 1}
+
 async def setup_jobs(application: Application) -> None:
     job_queue = application.job_queue
+
+    # Os jobs repetitivos começam com 15 min de distância entre si; como os intervalos são
+    # múltiplos de 1 hora, eles continuam defasados e nunca disputam o banco/Bot API juntos
     
-    # Agendar envio diário de palpites para 12:00 BRT (15:00 UTC) - todos os dias
+    # Horários de parede em BRAZIL_TZ: a JobQueue converte para UTC e os dias da semana
+    # também são contados no horário de Brasília
+
+    # Agendar envio diário de palpites para 12:00 BRT - todos os dias
     job_queue.run_daily(
         send_daily_predictions,
-        time=time(hour=15, minute=0),
-        name="send_daily_predictions_12h"
+        time=time(hour=12, minute=0, tzinfo=BRAZIL_TZ),
+        name="send_daily_predictions_12h",
+        job_kwargs=_JOB_KWARGS
     )
-    logger.info("Agendamento diário de palpites configurado para 12:00 BRT (15:00 UTC).")
+    logger.info("Agendamento diário de palpites configurado para 12:00 BRT.")
 
-    # Agendar envio extra aos sábados e domingos às 09:00 BRT (12:00 UTC)
+    # Agendar envio extra aos sábados e domingos às 09:00 BRT
     job_queue.run_daily(
         send_daily_predictions,
-        time=time(hour=12, minute=0),
-        days=(5, 6),  # 5=Sábado, 6=Domingo
-        name="send_daily_predictions_09h_weekend"
+        time=time(hour=9, minute=0, tzinfo=BRAZIL_TZ),
+        days=(6, 0),  # 6=Sábado, 0=Domingo
+        name="send_daily_predictions_09h_weekend",
+        job_kwargs=_JOB_KWARGS
     )
-    logger.info("Agendamento extra de palpites aos sábados e domingos às 09:00 BRT (12:00 UTC).")
+    logger.info("Agendamento extra de palpites aos sábados e domingos às 09:00 BRT.")
 
     # Agendar verificação de expiração de assinaturas a cada 6 horas
     job_queue.run_repeating(
         check_subscriptions_expiration,
         interval=6 * 3600,
         first=0,
-        name="check_subscriptions_expiration"
+        name="check_subscriptions_expiration",
+        job_kwargs=_JOB_KWARGS
     )
     logger.info("Agendamento de verificação de expiração de assinaturas configurado a cada 6 horas.")
 
@@ -1169,8 +1513,9 @@ async def setup_jobs(application: Application) -> None:
     job_queue.run_repeating(
         check_vip_members,
         interval=6 * 3600,
-        first=60,
-        name="check_vip_members"
+        first=900,
+        name="check_vip_members",
+        job_kwargs=_JOB_KWARGS
     )
     logger.info("PROTEÇÃO 2: Agendamento de verificação de membros do canal VIP configurado a cada 6 horas.")
 
@@ -1178,8 +1523,9 @@ async def setup_jobs(application: Application) -> None:
     job_queue.run_repeating(
         send_live_predictions,
         interval=2 * 3600,
-        first=300,  # Começa 5 minutos após iniciar
-        name="send_live_predictions"
+        first=1800,  # Começa 30 minutos após iniciar
+        name="send_live_predictions",
+        job_kwargs=_JOB_KWARGS
     )
     logger.info("Agendamento de palpites ao vivo configurado a cada 2 horas.")
 
@@ -1187,48 +1533,153 @@ async def setup_jobs(application: Application) -> None:
     job_queue.run_repeating(
         check_results,
         interval=3 * 3600,
-        first=600,  # Começa 10 minutos após iniciar
-        name="check_results"
+        first=2700,  # Começa 45 minutos após iniciar
+        name="check_results",
+        job_kwargs=_JOB_KWARGS
     )
     logger.info("MELHORIA 4: Agendamento de verificação de resultados configurado a cada 3 horas.")
 
-    # MELHORIA 5: Agendar resumo diário para 23:00 BRT (02:00 UTC do dia seguinte)
+    # Conferir os pagamentos Pix pendentes a cada 30 segundos
+    job_queue.run_repeating(
+        poll_pending_payments,
+        interval=30,
+        first=10,
+        name="poll_pending_payments",
+        job_kwargs=_JOB_KWARGS
+    )
+    logger.info("Agendamento de conferência de pagamentos pendentes configurado a cada 30 segundos.")
+
+    # MELHORIA 5: Agendar resumo diário para 23:00 BRT
     job_queue.run_daily(
         send_daily_summary,
-        time=time(hour=2, minute=0),
-        name="send_daily_summary_23h"
+        time=time(hour=23, minute=0, tzinfo=BRAZIL_TZ),
+        name="send_daily_summary_23h",
+        job_kwargs=_JOB_KWARGS
     )
-    logger.info("MELHORIA 5: Agendamento de resumo diário configurado para 23:00 BRT (02:00 UTC).")
+    logger.info("MELHORIA 5: Agendamento de resumo diário configurado para 23:00 BRT.")
+
+    # Manutenção do banco aos domingos às 04:00 BRT, fora dos horários de envio
+    job_queue.run_daily(
+        run_db_maintenance,
+        time=time(hour=4, minute=0, tzinfo=BRAZIL_TZ),
+        days=(0,),  # 0=Domingo
+        name="run_db_maintenance",
+        job_kwargs=_JOB_KWARGS
+    )
+    logger.info("Agendamento de manutenção do banco configurado para domingo às 04:00 BRT.")
 
 async def post_init(application: Application) -> None:
+    # Numa thread: a gravação do fallback bloqueia no writer e também aquece o cache de
+    # get_setting usado pelas chamadas seguintes no event loop
+    await asyncio.to_thread(persist_vip_channel_env_fallback)
     await setup_jobs(application)
+    await start_webhook_server(application)
+
+async def post_shutdown(application: Application) -> None:
+    runner = application.bot_data.get("webhook_runner")
+    if runner:
+        await runner.cleanup()
+
+    # Fechar os pools de conexões HTTP da API-Football e da OpenAI
+    await close_api_football_client()
+    await close_openai_client()
+    # E as conexões ociosas do SQLite
+    close_db_pool()
+
+async def run_telegram_webhook(application: Application) -> None:
+    """
+    Modo webhook: o Telegram envia cada update ao servidor aiohttp (o mesmo do Mercado Pago),
+    sem o intervalo do getUpdates. Repete o ciclo de vida do run_polling, inclusive
+    post_init/post_shutdown, até receber SIGINT/SIGTERM.
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await application.initialize()
+    try:
+        await post_init(application)
+        await application.bot.set_webhook(
+            url=TELEGRAM_WEBHOOK_URL,
+            allowed_updates=ALLOWED_UPDATES,
+            secret_token=TELEGRAM_WEBHOOK_SECRET
+        )
+        await application.start()
+        logger.info(f"Bot em modo webhook: {TELEGRAM_WEBHOOK_URL}")
+        await stop_event.wait()
+        await application.stop()
+    finally:
+        await application.shutdown()
+        await post_shutdown(application)
+
+# --- Comandos ---
+
+COMMAND_HANDLERS = {
+    # Comandos de usuário
+    "start": start_command,
+    "help": help_command,
+    "assinar": subscribe_command,
+    "status": status_command,
+    "palpites": predictions_command,
+    # Comandos de administração
+    "admin_forcar_envio": admin_force_send_predictions_command,
+    "admin_jogos": admin_games_command,
+    "admin_estatisticas": admin_stats_command,
+    "admin_setchannel": admin_setchannel_command,
+    "admin_aovivo": admin_force_live_command,
+    "admin_verificar_resultados": admin_force_check_results_command,
+    "admin_resumo": admin_force_summary_command,
+}
+
+async def command_dispatcher(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Encaminha /comando para a função de COMMAND_HANDLERS com um lookup no dicionário,
+    em vez de testar um CommandHandler por comando. Preenche context.args como o CommandHandler.
+    """
+    words = update.effective_message.text.split()
+    command, _, bot_username = words[0][1:].partition("@")
+    # Em grupos, /comando@outro_bot é para outro bot
+    if bot_username and bot_username.lower() != context.bot.username.lower():
+        return
+
+    handler = COMMAND_HANDLERS.get(command.lower())
+    if handler is None:
+        return
+    context.args = words[1:]
+    await handler(update, context)
 
 # --- Main --- 
 
 def main() -> None:
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).post_init(post_init).build()
+    # Updates tratados em paralelo: um /palpites ou /admin_jogos lento não segura os demais
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(256)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if TELEGRAM_WEBHOOK_URL:
+        # Os updates chegam pelo servidor aiohttp; o Updater (polling) não é necessário
+        builder = builder.updater(None)
+    application = builder.build()
 
-    # Comandos de usuário
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("assinar", subscribe_command))
-    application.add_handler(CommandHandler("status", status_command))
-    application.add_handler(CommandHandler("palpites", predictions_command))
+    # Todos os comandos passam por um único handler com lookup no dicionário; como no
+    # CommandHandler, mensagens editadas com um comando também são atendidas
+    application.add_handler(MessageHandler(filters.COMMAND & filters.UpdateType.MESSAGES, command_dispatcher))
 
     # Callback para botões inline
     application.add_handler(CallbackQueryHandler(button_callback_handler))
 
-    # Comandos de administração
-    application.add_handler(CommandHandler("admin_forcar_envio", admin_force_send_predictions_command))
-    application.add_handler(CommandHandler("admin_jogos", admin_games_command))
-    application.add_handler(CommandHandler("admin_estatisticas", admin_stats_command))
-    application.add_handler(CommandHandler("admin_setchannel", admin_setchannel_command))
-    application.add_handler(CommandHandler("admin_aovivo", admin_force_live_command))
-    application.add_handler(CommandHandler("admin_verificar_resultados", admin_force_check_results_command))
-    application.add_handler(CommandHandler("admin_resumo", admin_force_summary_command))
+    # Entradas/saídas no canal VIP (o bot precisa ser administrador do canal)
+    application.add_handler(ChatMemberHandler(vip_chat_member_handler, ChatMemberHandler.CHAT_MEMBER))
 
     # Iniciar o bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if TELEGRAM_WEBHOOK_URL:
+        asyncio.run(run_telegram_webhook(application))
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,262 @@
+"""
+Funções puras do caminho quente do bot: leitura da resposta da IA,
+classificação de odds, formatação das mensagens e avaliação RED/GREEN dos palpites.
+
+Não dependem do Telegram nem do banco, e por isso podem ser compiladas com
+mypyc (`mypyc bot_hot.py`) no build. Sem a extensão compilada, o Python
+importa este arquivo normalmente.
+"""
+import heapq
+import logging
+import math
+import re
+from datetime import datetime, timedelta, timezone
+from operator import itemgetter
+from typing import Any, Literal, Optional
+
+logger = logging.getLogger(__name__)
+
+Result = Literal["green", "red"]
+
+
+# Horário de Brasília (UTC-3, sem horário de verão)
+BRT = timezone(timedelta(hours=-3))
+
+
+def format_match_time_brt(fixture_date: str) -> str:
+    """Converte a data ISO (UTC) de uma fixture da API-Football em "HH:MM BRT"."""
+    if fixture_date.endswith("Z"):
+        fixture_date = fixture_date[:-1] + "+00:00"
+    match_time = datetime.fromisoformat(fixture_date).astimezone(BRT)
+    return f"{match_time.hour:02d}:{match_time.minute:02d} BRT"
+
+
+# =====================================================
+# Leitura da resposta em texto da IA
+# =====================================================
+
+# Uma única passada sobre o texto inteiro, em vez de testar cada campo em cada linha
+_AI_RE = re.compile(
+    r"^\s*(?P<key>Análise|Palpite|Confiança|Mercado|Odd Sugerida):\s*(?P<val>.+)$",
+    re.MULTILINE
+)
+# Uma passada só para trocar a vírgula decimal e remover o "%" (em vez de dois .replace)
+_NUMBER_TRANS = str.maketrans(",", ".", "%")
+
+
+def parse_ai_response(text: str) -> dict[str, Any]:
+    """
+    Converte a resposta da IA (formato "Campo: valor" por linha) no dicionário de palpite.
+    Campos ausentes ficam com o valor padrão ("N/A" ou 0.0). Confiança vira fração (0-1).
+    Levanta ValueError se Confiança ou Odd Sugerida não forem numéricas.
+    """
+    fields = {m["key"]: m["val"].strip() for m in _AI_RE.finditer(text)}
+    confidence = fields.get("Confiança")
+    suggested_odd = fields.get("Odd Sugerida")
+    return {
+        "analysis": fields.get("Análise", "N/A"),
+        "prediction": fields.get("Palpite", "N/A"),
+        "confidence": float(confidence.translate(_NUMBER_TRANS)) / 100.0 if confidence else 0.0,
+        "market": fields.get("Mercado", "N/A"),
+        "suggested_odd": float(suggested_odd.translate(_NUMBER_TRANS)) if suggested_odd else 0.0,
+    }
+
+
+# =====================================================
+# MELHORIA 1 & 2 - Classificação de Odds e Gestão de Banca
+# =====================================================
+
+# Trechos fixos das mensagens, montados uma única vez em vez de a cada palpite
+DAILY_HEADER = "⚡ ZEUS TIPS - PALPITE DO DIA ⚡"
+LIVE_HEADER = "🔴 ZEUS TIPS - AO VIVO 🔴"
+_BANKROLL_LINES = {pct: f"💼 Gestão: Aposte {pct} da sua banca" for pct in ("5%", "3%", "1-2%")}
+
+
+def classify_odd(odd_value: Any) -> tuple[str, str]:
+    """
+    Classifica a odd sugerida e retorna o emoji, a classificação e a % da banca.
+    - 🟢 SEGURA: odds até 1.50 → 5% da banca
+    - 🟡 MÉDIA: odds entre 1.51 e 2.00 → 3% da banca
+    - 🔴 ALTA: odds acima de 2.00 → 1-2% da banca
+    """
+    try:
+        odd: float = float(odd_value)
+    except (ValueError, TypeError):
+        odd = 0.0
+
+    if odd <= 1.50:
+        return "🟢 SEGURA", "5%"
+    elif odd <= 2.00:
+        return "🟡 MÉDIA", "3%"
+    else:
+        return "🔴 ALTA", "1-2%"
+
+
+def format_prediction_message(pred: dict[str, Any], header: str = DAILY_HEADER) -> str:
+    """
+    Formata a mensagem de um palpite individual incluindo:
+    - Classificação de odd (Melhoria 1)
+    - Gestão de banca (Melhoria 2)
+    """
+    odd_class, banca_pct = classify_odd(pred.get("suggested_odd", 0))
+
+    parts = [
+        header,
+        f"🏆 Campeonato: {pred['championship']}",
+        f"⚽ Jogo: {pred['team_a']} vs {pred['team_b']}",
+        f"⏰ Horário: {pred['match_time']}",
+        f"📊 Análise: {pred['analysis']}",
+        f"🎯 Palpite: {pred['prediction']} ({pred.get('market', 'N/A')})",
+        f"📈 Confiança: {pred['confidence'] * 100:.0f}%",
+        f"💰 Odd sugerida: {pred['suggested_odd']:.2f} {odd_class}",
+        _BANKROLL_LINES[banca_pct],
+        "",
+    ]
+    return "\n".join(parts)
+
+
+def format_live_prediction_message(pred: dict[str, Any], home_goals: Any, away_goals: Any, elapsed: Any) -> str:
+    """
+    Formata a mensagem de um palpite ao vivo incluindo:
+    - Classificação de odd (Melhoria 1)
+    - Gestão de banca (Melhoria 2)
+    """
+    odd_class, banca_pct = classify_odd(pred.get("suggested_odd", 0))
+
+    parts = [
+        LIVE_HEADER,
+        f"🏆 Campeonato: {pred['championship']}",
+        f"⚽ Jogo: {pred['team_a']} {home_goals} x {away_goals} {pred['team_b']}",
+        f"⏱ Tempo: {elapsed}'",
+        f"📊 Análise: {pred['analysis']}",
+        f"🎯 Palpite: {pred['prediction']} ({pred.get('market', 'N/A')})",
+        f"📈 Confiança: {pred['confidence'] * 100:.0f}%",
+        f"💰 Odd sugerida: {pred['suggested_odd']:.2f} {odd_class}",
+        _BANKROLL_LINES[banca_pct],
+        "",
+    ]
+    return "\n".join(parts)
+
+
+# =====================================================
+# MELHORIA 3 - Múltipla Diária (função auxiliar)
+# =====================================================
+
+def build_daily_multiple_message(all_predictions: list[dict[str, Any]]) -> Optional[str]:
+    """
+    Constrói a mensagem da aposta múltipla diária.
+    Seleciona os 3 palpites com maior confiança e calcula a odd combinada.
+    A lista pode vir em qualquer ordem.
+    """
+    if len(all_predictions) < 3:
+        return None
+
+    # Seleção dos 3 de maior confiança em O(N log 3), sem depender da ordenação do chamador
+    top3 = heapq.nlargest(3, all_predictions, key=itemgetter("confidence"))
+    combined_odd = math.prod(p["suggested_odd"] for p in top3)
+    # Classificar cada odd uma única vez
+    odd_meta = [(p, *classify_odd(p["suggested_odd"])) for p in top3]
+
+    parts = [
+        "🔱 ZEUS TIPS - MÚLTIPLA DO DIA 🔱",
+        "━━━━━━━━━━━━━━━━━━━━━━━━",
+        "",
+    ]
+
+    for i, (p, odd_class, _) in enumerate(odd_meta, 1):
+        parts += [
+            f"🎯 Jogo {i}:",
+            f"   🏆 {p['championship']}",
+            f"   ⚽ {p['team_a']} vs {p['team_b']}",
+            f"   📊 Palpite: {p['prediction']} ({p.get('market', 'N/A')})",
+            f"   💰 Odd: {p['suggested_odd']:.2f} {odd_class}",
+            f"   📈 Confiança: {p['confidence'] * 100:.0f}%",
+            "",
+        ]
+
+    parts += [
+        "━━━━━━━━━━━━━━━━━━━━━━━━",
+        f"💰 Odd combinada: {combined_odd:.2f}",
+        "💼 Gestão: Aposte 1% da sua banca para múltiplas",
+        "━━━━━━━━━━━━━━━━━━━━━━━━",
+        "⚠️ Múltiplas possuem risco elevado. Aposte com responsabilidade!",
+    ]
+    return "\n".join(parts)
+
+
+# =====================================================
+# MELHORIA 4 - Verificação de Resultados (RED/GREEN)
+# =====================================================
+
+# Padrões compilados uma única vez (evaluate_prediction roda para cada palpite pendente)
+_OVER_RE = re.compile(r'over\s*(\d+[.,]?\d*)')
+_UNDER_RE = re.compile(r'under\s*(\d+[.,]?\d*)')
+_WORD_RE = re.compile(r'\w+')
+
+
+def evaluate_prediction(prediction_text: str, fixture_result: Optional[dict[str, Any]]) -> Optional[Result]:
+    """
+    Compara o palpite dado com o resultado real do jogo.
+    Retorna 'green' se acertou, 'red' se errou.
+    
+    Lógica de avaliação:
+    - Resultado Final (1X2): compara com o vencedor real
+    - Over/Under: compara com total de gols
+    - Ambas Marcam: verifica se ambos os times marcaram
+    """
+    if not fixture_result:
+        return None
+
+    home_goals = fixture_result.get("home_goals", 0) or 0
+    away_goals = fixture_result.get("away_goals", 0) or 0
+    total_goals = home_goals + away_goals
+    home_team = fixture_result.get("home_team", "").casefold()
+    away_team = fixture_result.get("away_team", "").casefold()
+
+    pred_lower = prediction_text.casefold().strip()
+
+    # --- Avaliação de Over/Under ---
+    over_match = _OVER_RE.search(pred_lower)
+    if over_match:
+        line = float(over_match.group(1).replace(",", "."))
+        return "green" if total_goals > line else "red"
+
+    under_match = _UNDER_RE.search(pred_lower)
+    if under_match:
+        line = float(under_match.group(1).replace(",", "."))
+        return "green" if total_goals < line else "red"
+
+    # --- Avaliação de Ambas Marcam ---
+    if "ambas marcam" in pred_lower or "btts" in pred_lower:
+        if "não" in pred_lower or "no" in pred_lower:
+            return "green" if (home_goals == 0 or away_goals == 0) else "red"
+        else:
+            return "green" if (home_goals > 0 and away_goals > 0) else "red"
+
+    # --- Avaliação de Resultado Final (1X2) ---
+    # Verificar se o palpite menciona vitória de um time (interseção de conjuntos de palavras)
+    pred_tokens = set(_WORD_RE.findall(pred_lower))
+    home_words = {w for w in _WORD_RE.findall(home_team) if len(w) > 3}
+    away_words = {w for w in _WORD_RE.findall(away_team) if len(w) > 3}
+
+    pred_mentions_home = not pred_tokens.isdisjoint(home_words)
+    pred_mentions_away = not pred_tokens.isdisjoint(away_words)
+
+    if "empate" in pred_lower or "draw" in pred_lower:
+        return "green" if home_goals == away_goals else "red"
+
+    if "vitória" in pred_lower or "vencer" in pred_lower or "win" in pred_lower or "ganha" in pred_lower:
+        if pred_mentions_home and not pred_mentions_away:
+            return "green" if home_goals > away_goals else "red"
+        elif pred_mentions_away and not pred_mentions_home:
+            return "green" if away_goals > home_goals else "red"
+
+    # Se menciona o nome do time diretamente como palpite
+    if pred_mentions_home and not pred_mentions_away:
+        return "green" if home_goals > away_goals else "red"
+    elif pred_mentions_away and not pred_mentions_home:
+        return "green" if away_goals > home_goals else "red"
+
+    # Fallback: se não conseguiu interpretar, marca como red por segurança
+    logger.warning(f"Não foi possível avaliar o palpite '{prediction_text}' com precisão. Marcando como 'red'.")
+    return "red"
@@ -1,10 +1,261 @@
+import os
+import queue
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+DB_PATH = "zeus_tips.db"
+
+# Conexões de leitura (somente leitura) reaproveitadas entre as chamadas: mantêm o cache de
+# páginas do SQLite e evitam abrir/fechar o arquivo a cada consulta. Se todas estiverem em
+# uso, abre-se uma extra. As escritas usam só a conexão do _DbWriter.
+# O tamanho acompanha o executor padrão do asyncio.to_thread (min(32, CPUs + 4) threads),
+# para que uma rajada de consultas não abra e feche conexões extras a cada chamada.
+_POOL_SIZE = min(32, (os.cpu_count() or 1) + 4)
+_pool: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue(maxsize=_POOL_SIZE)
+
+# Cache em memória das configurações (bot_settings). Elas só mudam via set_setting,
+# que atualiza o cache; o TTL cobre alterações feitas direto no banco.
+_SETTINGS_CACHE_TTL = 3600
+_settings_cache: dict[str, tuple[Optional[str], float]] = {}
+
+
+def _now_str():
+    """Data/hora local no formato 'YYYY-MM-DD HH:MM:SS' usado em todas as colunas de data."""
+    # isoformat é implementado em C e gera o mesmo texto que strftime, só que mais rápido
+    return datetime.now().isoformat(sep=" ", timespec="seconds")
+
+
+def _new_connection(read_only=False):
+    # check_same_thread=False: a conexão pode ser usada por threads diferentes (asyncio.to_thread),
+    # mas nunca por duas ao mesmo tempo, já que só uma chamada a retira do pool por vez
+    if read_only and DB_PATH != ":memory:":
+        # mode=ro: em WAL os leitores nunca pegam o lock de escrita, e um write acidental
+        # fora do _DbWriter falha na hora em vez de disputar o banco
+        database = f"{Path(DB_PATH).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(database, uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    _configure(conn)
+    return conn
+
+
+def _configure(conn):
+    """PRAGMAs que valem por conexão: aplicados em toda conexão nova do pool."""
+    # NORMAL é seguro em WAL (ver init_db) e faz menos fsync por commit
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA busy_timeout=5000")
+    # Tabelas temporárias (ORDER BY/GROUP BY grandes) em memória e leitura do arquivo via mmap
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+
+
+@contextmanager
+def _connection():
+    """Empresta uma conexão de leitura do pool (ou abre uma nova) e a devolve ao final."""
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _new_connection(read_only=True)
+    try:
+        yield conn
+    finally:
+        # Não devolver ao pool uma transação pela metade (ex.: exceção antes do commit)
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            _pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+# Sentinela que encerra a thread de escrita
+_WRITER_STOP = ("stop",)
+
+
+class _DbWriter:
+    """
+    Thread única de escrita com conexão própria. O SQLite só aceita um escritor por vez:
+    em vez de cada helper disputar o lock do banco (e esperar o busy_timeout), as escritas
+    entram numa fila e são aplicadas em ordem. O que chegar enquanto um commit está em
+    andamento vai junto no próximo (até _MAX_BATCH escritas por transação/fsync).
+    """
+    _MAX_BATCH = 64
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def execute(self, sql, params=(), many=False):
+        """
+        Enfileira uma escrita e espera o commit. Retorna as linhas do RETURNING, se a
+        instrução tiver um, ou o rowcount. Erros da instrução são relançados aqui.
+        """
+        return self._submit(sql, params, many)
+
+    def run(self, fn):
+        """
+        Executa fn(conn) na thread de escrita, fora de transação e depois das escritas já
+        enfileiradas (manutenção, ou escritas que controlam a própria transação).
+        Retorna o resultado de fn.
+        """
+        return self._submit(fn, None, False)
+
+    def _submit(self, sql, params, many):
+        future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+            self._queue.put((sql, params, many, future))
+        return future.result()
+
+    def close(self):
+        """Aplica as escritas pendentes e encerra a thread (ela é recriada se necessário)."""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._queue.put(_WRITER_STOP)
+            thread, self._thread = self._thread, None
+        thread.join()
+
+    def _run(self):
+        conn = _new_connection()
+        # Transações controladas explicitamente (BEGIN/COMMIT) em _write
+        conn.isolation_level = None
+        # Item já retirado da fila que não entra no lote atual (parada ou manutenção)
+        leftover = None
+        while True:
+            item = leftover or self._queue.get()
+            leftover = None
+            if item is _WRITER_STOP:
+                break
+            if callable(item[0]):
+                self._call(conn, item)
+                continue
+            batch = [item]
+            while len(batch) < self._MAX_BATCH:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _WRITER_STOP or callable(item[0]):
+                    leftover = item
+                    break
+                batch.append(item)
+            self._write(conn, batch)
+        conn.close()
+
+    def _call(self, conn, item):
+        fn, _, _, future = item
+        try:
+            future.set_result(fn(conn))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _write(self, conn, batch):
+        done = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for sql, params, many, future in batch:
+                # Savepoint por escrita: uma instrução com erro não desfaz as outras do lote
+                conn.execute("SAVEPOINT escrita")
+                try:
+                    cursor = conn.executemany(sql, params) if many else conn.execute(sql, params)
+                    result = cursor.fetchall() if cursor.description else cursor.rowcount
+                    conn.execute("RELEASE escrita")
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO escrita")
+                    conn.execute("RELEASE escrita")
+                    future.set_exception(e)
+                    continue
+                done.append((future, result))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in done:
+            future.set_result(result)
+
+
+_writer = _DbWriter()
+
+
+def run_maintenance(vacuum_pages=500):
+    """
+    Manutenção periódica, na thread de escrita: checkpoint do WAL truncando o arquivo -wal
+    e devolução ao sistema de até `vacuum_pages` páginas livres (auto_vacuum incremental).
+    """
+    def maintenance(conn):
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        conn.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})").fetchall()
+
+    _writer.run(maintenance)
+
+
+def close_db_pool():
+    """Encerra a thread de escrita e fecha as conexões ociosas do pool (chamado no encerramento do bot)."""
+    _writer.close()
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+
+# Versão do esquema gravada em PRAGMA user_version por _create_schema. Bancos nessa versão
+# pulam toda a DDL no início; qualquer tabela, índice ou trigger novo exige incrementá-la.
+# 2: migração de predictions_history; 3: auto_vacuum incremental e idx_predictions_pending.
+_SCHEMA_VERSION = 3
 
 
 def init_db():
-    conn = sqlite3.connect("zeus_tips.db")
+    # Conexão de escrita própria (o pool é somente leitura)
+    conn = _new_connection()
+    try:
+        cursor = conn.cursor()
+        # Caminho rápido: esquema já na versão atual, sem DDL nem migração a cada reinício
+        cursor.execute("PRAGMA user_version")
+        if cursor.fetchone()[0] != _SCHEMA_VERSION:
+            _create_schema(conn)
+
+        # Entradas vencidas do cache de APIs saem a cada início
+        cursor.execute("DELETE FROM api_cache WHERE expires_at <= ?", (time.time(),))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _create_schema(conn):
+    """Cria/migra todas as tabelas, índices e triggers e grava _SCHEMA_VERSION."""
     cursor = conn.cursor()
+    # WAL permite leituras concorrentes com a escrita e fica gravado no arquivo do banco:
+    # basta ativar uma vez, não a cada conexão (bancos em memória não usam WAL)
+    if DB_PATH != ":memory:":
+        cursor.execute("PRAGMA journal_mode=WAL")
+
+        # auto_vacuum=INCREMENTAL: páginas livres são devolvidas aos poucos pela manutenção
+        # semanal (run_maintenance). Em bancos existentes o modo só muda com um VACUUM,
+        # feito uma única vez aqui.
+        cursor.execute("PRAGMA auto_vacuum")
+        if cursor.fetchone()[0] != 2:
+            cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            cursor.execute("VACUUM")
+
+    # Todo o esquema numa única transação: o sqlite3 não abre transação para DDL, e
+    # cada CREATE/ALTER avulso seria um commit (e um fsync) separado
+    cursor.execute("BEGIN")
 
     # Tabela para assinantes
     cursor.execute("""
@@ -44,11 +295,129 @@ def init_db():
         )
     """)
 
+    # Tabela de cache (com TTL) das respostas de APIs externas
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS api_cache (
+            cache_key TEXT PRIMARY KEY,
+            value TEXT,
+            expires_at REAL
+        )
+    """)
+
+    # Tabela de notificações de pagamento já processadas (idempotência do webhook)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS payment_events (
+            payment_id TEXT,
+            event TEXT,
+            received_at TEXT,
+            PRIMARY KEY (payment_id, event)
+        )
+    """)
+
+    # Situação conhecida de cada usuário no canal VIP, mantida pelos updates chat_member
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS vip_channel_members (
+            channel_id INTEGER,
+            user_id INTEGER,
+            status TEXT,
+            updated_at TEXT,
+            PRIMARY KEY (channel_id, user_id)
+        )
+    """)
+
+    # Último Pix gerado por usuário, para o /status confirmar o pagamento depois de um reinício
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pending_payments (
+            user_id INTEGER PRIMARY KEY,
+            payment_id TEXT,
+            plan_key TEXT,
+            created_at TEXT
+        )
+    """)
+
     # --- Migração: adicionar colunas que podem não existir em bancos antigos ---
     _migrate_predictions_history(cursor)
 
+    # Índice para a expiração de assinaturas (filtra por status e data de término)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_subscribers_status_end_date ON subscribers (status, end_date)")
+
+    # Índice para as consultas por dia (resumo diário)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_predictions_date_added ON predictions_history (date_added)")
+
+    # Índice parcial só com os palpites pendentes (busca do check_results): fica pequeno,
+    # já que quase todo palpite vira green/red. As contagens do /admin_estatisticas vêm
+    # de stats_snapshot e as de assinantes usam idx_subscribers_status_end_date.
+    cursor.execute("DROP INDEX IF EXISTS idx_predictions_result")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_predictions_pending ON predictions_history (id) WHERE result = 'pending'"
+    )
+
+    _create_stats_snapshot(cursor)
+
+    # user_version fica no cabeçalho do arquivo e muda na mesma transação do esquema
+    cursor.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
     conn.commit()
-    conn.close()
+
+    # Estatísticas para o planejador de consultas escolher os índices
+    cursor.execute("ANALYZE")
+
+
+def _create_stats_snapshot(cursor):
+    """
+    Contadores de palpites por resultado numa linha única (id = 1), mantidos por triggers
+    em predictions_history. O /admin_estatisticas lê a linha em vez de contar a tabela.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stats_snapshot (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total INTEGER NOT NULL,
+            greens INTEGER NOT NULL,
+            reds INTEGER NOT NULL,
+            pending INTEGER NOT NULL
+        )
+    """)
+    # Bancos existentes: a linha nasce com as contagens atuais, na mesma transação dos triggers
+    cursor.execute("""
+        INSERT OR IGNORE INTO stats_snapshot (id, total, greens, reds, pending)
+        SELECT 1, COUNT(*),
+               COUNT(*) FILTER (WHERE result = 'green'),
+               COUNT(*) FILTER (WHERE result = 'red'),
+               COUNT(*) FILTER (WHERE result = 'pending')
+        FROM predictions_history
+    """)
+    # "IS" em vez de "=" para que um result NULL conte como 0, e não anule o contador
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS stats_snapshot_insert AFTER INSERT ON predictions_history
+        BEGIN
+            UPDATE stats_snapshot SET
+                total = total + 1,
+                greens = greens + (NEW.result IS 'green'),
+                reds = reds + (NEW.result IS 'red'),
+                pending = pending + (NEW.result IS 'pending')
+            WHERE id = 1;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS stats_snapshot_update AFTER UPDATE OF result ON predictions_history
+        BEGIN
+            UPDATE stats_snapshot SET
+                greens = greens + (NEW.result IS 'green') - (OLD.result IS 'green'),
+                reds = reds + (NEW.result IS 'red') - (OLD.result IS 'red'),
+                pending = pending + (NEW.result IS 'pending') - (OLD.result IS 'pending')
+            WHERE id = 1;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS stats_snapshot_delete AFTER DELETE ON predictions_history
+        BEGIN
+            UPDATE stats_snapshot SET
+                total = total - 1,
+                greens = greens - (OLD.result IS 'green'),
+                reds = reds - (OLD.result IS 'red'),
+                pending = pending - (OLD.result IS 'pending')
+            WHERE id = 1;
+        END
+    """)
 
 
 def _migrate_predictions_history(cursor):
@@ -80,115 +449,364 @@ def _migrate_predictions_history(cursor):
 
 
 def get_setting(key):
-    conn = sqlite3.connect("zeus_tips.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT value FROM bot_settings WHERE key = ?", (key,))
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] if result else None
+    cached = _settings_cache.get(key)
+    if cached and time.monotonic() < cached[1]:
+        return cached[0]
+
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT value FROM bot_settings WHERE key = ?", (key,))
+        result = cursor.fetchone()
+    value = result[0] if result else None
+    _settings_cache[key] = (value, time.monotonic() + _SETTINGS_CACHE_TTL)
+    return value
 
 
 def set_setting(key, value):
-    conn = sqlite3.connect("zeus_tips.db")
-    cursor = conn.cursor()
-    cursor.execute("INSERT OR REPLACE INTO bot_settings (key, value) VALUES (?, ?)", (key, value))
-    conn.commit()
-    conn.close()
+    _writer.execute(
+        "INSERT INTO bot_settings (key, value) VALUES (?, ?) "
+        "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+        (key, value)
+    )
+    _settings_cache[key] = (value, time.monotonic() + _SETTINGS_CACHE_TTL)
 
 
-def add_subscriber(user_id, username, plan, end_date):
-    conn = sqlite3.connect("zeus_tips.db")
-    cursor = conn.cursor()
-    start_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    cursor.execute(
-        "INSERT OR REPLACE INTO subscribers (user_id, username, start_date, end_date, plan, status) VALUES (?, ?, ?, ?, ?, ?)",
-        (user_id, username, start_date, end_date, plan, "active")
+def get_cache_entry(cache_key):
+    """Retorna o valor em cache para a chave, ou None se não existir ou estiver expirado."""
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT value FROM api_cache WHERE cache_key = ? AND expires_at > ?",
+            (cache_key, time.time())
+        )
+        result = cursor.fetchone()
+    return result[0] if result else None
+
+
+def get_cache_entry_with_expiry(cache_key):
+    """Como get_cache_entry, mas retorna (valor, expires_at) para quem também guarda em memória."""
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT value, expires_at FROM api_cache WHERE cache_key = ? AND expires_at > ?",
+            (cache_key, time.time())
+        )
+        result = cursor.fetchone()
+    return result
+
+
+def set_cache_entry(cache_key, value, ttl):
+    """Grava um valor no cache com validade de `ttl` segundos."""
+    _writer.execute(
+        "INSERT INTO api_cache (cache_key, value, expires_at) VALUES (?, ?, ?) "
+        "ON CONFLICT (cache_key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+        (cache_key, value, time.time() + ttl)
     )
-    conn.commit()
-    conn.close()
 
 
-def get_subscriber(user_id):
-    conn = sqlite3.connect("zeus_tips.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT user_id, username, start_date, end_date, plan, status FROM subscribers WHERE user_id = ?",
-        (user_id,)
+def set_cache_entries(entries, ttl):
+    """
+    Grava várias entradas no cache numa única transação, todas com validade de `ttl` segundos.
+    `entries` é uma lista de tuplas (cache_key, value).
+    """
+    if not entries:
+        return
+    expires_at = time.time() + ttl
+    _writer.execute(
+        "INSERT INTO api_cache (cache_key, value, expires_at) VALUES (?, ?, ?) "
+        "ON CONFLICT (cache_key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+        [(cache_key, value, expires_at) for cache_key, value in entries],
+        many=True
+    )
+
+
+def register_payment_event(payment_id, event):
+    """
+    Registra um evento de pagamento. Retorna True se o evento é novo e
+    False se (payment_id, event) já havia sido processado.
+    """
+    received_at = _now_str()
+    inserted = _writer.execute(
+        "INSERT OR IGNORE INTO payment_events (payment_id, event, received_at) VALUES (?, ?, ?)",
+        (str(payment_id), event, received_at)
+    )
+    return inserted == 1
+
+
+def set_pending_payment(user_id, payment_id, plan_key):
+    """Grava o último pagamento gerado pelo usuário (substitui o anterior)."""
+    created_at = _now_str()
+    _writer.execute(
+        "INSERT INTO pending_payments (user_id, payment_id, plan_key, created_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (user_id) DO UPDATE SET payment_id = excluded.payment_id, "
+        "plan_key = excluded.plan_key, created_at = excluded.created_at",
+        (user_id, str(payment_id), plan_key, created_at)
+    )
+
+
+def get_pending_payment(user_id):
+    """Retorna (payment_id, plan_key) do último pagamento do usuário, ou None."""
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT payment_id, plan_key FROM pending_payments WHERE user_id = ?",
+            (user_id,)
+        )
+        return cursor.fetchone()
+
+
+def get_pending_payments(min_age, max_age):
+    """
+    Retorna (user_id, payment_id, plan_key) dos pagamentos gerados há mais de `min_age`
+    e menos de `max_age` segundos.
+    """
+    now = datetime.now()
+    newest = (now - timedelta(seconds=min_age)).isoformat(sep=" ", timespec="seconds")
+    oldest = (now - timedelta(seconds=max_age)).isoformat(sep=" ", timespec="seconds")
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT user_id, payment_id, plan_key FROM pending_payments WHERE created_at BETWEEN ? AND ?",
+            (oldest, newest)
+        )
+        return cursor.fetchall()
+
+
+def delete_pending_payment(user_id, payment_id):
+    """Remove o pagamento pendente do usuário, se ainda for o mesmo (um Pix novo não é apagado)."""
+    _writer.execute(
+        "DELETE FROM pending_payments WHERE user_id = ? AND payment_id = ?",
+        (user_id, str(payment_id))
+    )
+
+
+def set_vip_member_status(channel_id, user_id, status):
+    """Grava o status (member, left, kicked...) de um usuário no canal VIP."""
+    set_vip_member_statuses([(channel_id, user_id, status)])
+
+
+def set_vip_member_statuses(statuses):
+    """
+    Grava vários status do canal VIP numa única transação.
+    `statuses` é uma lista de tuplas (channel_id, user_id, status).
+    """
+    if not statuses:
+        return
+    updated_at = _now_str()
+    _writer.execute(
+        "INSERT INTO vip_channel_members (channel_id, user_id, status, updated_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (channel_id, user_id) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at",
+        [(*entry, updated_at) for entry in statuses],
+        many=True
     )
-    result = cursor.fetchone()
-    conn.close()
+
+
+def get_vip_member_statuses(channel_id):
+    """Retorna {user_id: status} de todos os usuários conhecidos do canal VIP."""
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT user_id, status FROM vip_channel_members WHERE channel_id = ?",
+            (channel_id,)
+        )
+        results = cursor.fetchall()
+    return dict(results)
+
+
+_UPSERT_SUBSCRIBER_SQL = (
+    "INSERT INTO subscribers (user_id, username, start_date, end_date, plan, status) VALUES (?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (user_id) DO UPDATE SET username = COALESCE(excluded.username, username), "
+    "end_date = excluded.end_date, plan = excluded.plan, status = excluded.status"
+)
+
+
+def add_subscriber(user_id, username, plan, end_date):
+    """
+    Cria ou renova a assinatura do usuário. Na renovação (UPSERT em vez de REPLACE, que
+    apagaria e recriaria a linha) o start_date original é mantido, assim como o username
+    conhecido quando o novo não é informado (ativação pelo webhook ou pela conferência).
+    """
+    start_date = _now_str()
+    _writer.execute(_UPSERT_SUBSCRIBER_SQL, (user_id, username, start_date, end_date, plan, "active"))
+
+
+def activate_subscriber_for_payment(payment_id, user_id, username, plan, end_date):
+    """
+    Registra o evento 'activated' do pagamento e cria/renova a assinatura numa única
+    transação: ou as duas coisas ficam gravadas, ou nenhuma (e uma nova tentativa ativa).
+    Retorna False, sem alterar nada, se o pagamento já tinha ativado uma assinatura.
+    """
+    now = _now_str()
+
+    def activate(conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO payment_events (payment_id, event, received_at) VALUES (?, 'activated', ?)",
+                (str(payment_id), now)
+            )
+            if cursor.rowcount != 1:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute(_UPSERT_SUBSCRIBER_SQL, (user_id, username, now, end_date, plan, "active"))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        return True
+
+    return _writer.run(activate)
+
+
+def get_subscriber(user_id):
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT user_id, username, start_date, end_date, plan, status FROM subscribers WHERE user_id = ?",
+            (user_id,)
+        )
+        result = cursor.fetchone()
     return result
 
 
+def get_subscriber_status(user_id):
+    """Retorna só o status da assinatura do usuário (ou None), para quem não precisa do resto."""
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT status FROM subscribers WHERE user_id = ?", (user_id,))
+        result = cursor.fetchone()
+    return result[0] if result else None
+
+
 def update_subscriber_status(user_id, status):
-    conn = sqlite3.connect("zeus_tips.db")
-    cursor = conn.cursor()
-    cursor.execute(
+    _writer.execute(
         "UPDATE subscribers SET status = ? WHERE user_id = ?",
         (status, user_id)
     )
-    conn.commit()
-    conn.close()
 
 
 def get_all_active_subscribers():
-    conn = sqlite3.connect("zeus_tips.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT user_id, end_date FROM subscribers WHERE status = 'active'"
-    )
-    results = cursor.fetchall()
-    conn.close()
+    """
+    Retorna os user_ids com assinatura ativa e ainda dentro do prazo. O filtro de data fica
+    no SQLite (faixa em idx_subscribers_status_end_date, que já contém o user_id), então
+    só cruzam para o Python os ids realmente ativos, mesmo antes do job de expiração rodar.
+    """
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT user_id FROM subscribers WHERE status = 'active' AND end_date >= ?",
+            (_now_str(),)
+        )
+        results = [row[0] for row in cursor.fetchall()]
     return results
 
 
-def get_all_subscribers():
-    conn = sqlite3.connect("zeus_tips.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT user_id, status FROM subscribers"
+def expire_subscriptions_due():
+    """
+    Marca como 'expired', num único UPDATE, as assinaturas ativas com término já passado
+    e retorna os user_ids afetados. As datas ficam no formato 'YYYY-MM-DD HH:MM:SS'
+    (hora local), que compara corretamente como texto.
+    """
+    now = _now_str()
+    rows = _writer.execute(
+        "UPDATE subscribers SET status = 'expired' WHERE status = 'active' AND end_date < ? RETURNING user_id",
+        (now,)
     )
-    results = cursor.fetchall()
-    conn.close()
+    return [row[0] for row in rows]
+
+
+def get_subscriber_ids_by_activity():
+    """
+    Retorna (ids ativos, ids não ativos) dos assinantes. As duas consultas são respondidas
+    pelo índice (status, end_date), que já contém o user_id (rowid), sem ler a tabela.
+    """
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT user_id FROM subscribers WHERE status = 'active'")
+        active_ids = {row[0] for row in cursor.fetchall()}
+        cursor.execute("SELECT user_id FROM subscribers WHERE status IS NOT 'active'")
+        inactive_ids = {row[0] for row in cursor.fetchall()}
+    return active_ids, inactive_ids
+
+
+def get_all_subscribers():
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT user_id, status FROM subscribers"
+        )
+        results = cursor.fetchall()
     return results
 
 
 def add_prediction_history(fixture_id, championship, team_a, team_b, match_time, analysis, prediction, confidence, suggested_odd):
     """Adiciona um palpite ao histórico com status 'pending'."""
-    conn = sqlite3.connect("zeus_tips.db")
-    cursor = conn.cursor()
-    date_added = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    cursor.execute(
+    add_prediction_history_bulk([
+        (fixture_id, championship, team_a, team_b, match_time, analysis, prediction, confidence, suggested_odd)
+    ])
+
+
+def add_prediction_history_bulk(predictions):
+    """
+    Adiciona vários palpites ao histórico (status 'pending') numa única transação
+    (um único commit/fsync para o lote inteiro).
+    `predictions` é uma lista de tuplas (fixture_id, championship, team_a, team_b,
+    match_time, analysis, prediction, confidence, suggested_odd).
+    """
+    if not predictions:
+        return
+    date_added = _now_str()
+    _writer.execute(
         "INSERT INTO predictions_history (fixture_id, championship, team_a, team_b, match_time, analysis, prediction, confidence, suggested_odd, result, date_added) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (fixture_id, championship, team_a, team_b, match_time, analysis, prediction, confidence, suggested_odd, "pending", date_added)
+        [(*pred, "pending", date_added) for pred in predictions],
+        many=True
     )
-    conn.commit()
-    conn.close()
 
 
 def get_pending_predictions():
-    """Retorna todos os palpites com resultado pendente."""
-    conn = sqlite3.connect("zeus_tips.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, fixture_id, championship, team_a, team_b, match_time, prediction, confidence, suggested_odd, date_added "
-        "FROM predictions_history WHERE result = 'pending'"
-    )
-    results = cursor.fetchall()
-    conn.close()
+    """
+    Retorna todos os palpites com resultado pendente, só com as colunas que o
+    check_results usa: (id, fixture_id, championship, team_a, team_b, prediction, suggested_odd).
+    """
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, fixture_id, championship, team_a, team_b, prediction, suggested_odd "
+            "FROM predictions_history WHERE result = 'pending'"
+        )
+        results = cursor.fetchall()
     return results
 
 
 def update_prediction_result(prediction_id, result):
     """Atualiza o resultado de um palpite (green, red)."""
-    conn = sqlite3.connect("zeus_tips.db")
-    cursor = conn.cursor()
-    cursor.execute(
+    _writer.execute(
         "UPDATE predictions_history SET result = ? WHERE id = ?",
         (result, prediction_id)
     )
-    conn.commit()
-    conn.close()
+
+
+def update_prediction_results_bulk(results):
+    """
+    Atualiza o resultado de vários palpites numa única transação.
+    `results` é uma lista de tuplas (result, prediction_id).
+    """
+    _writer.execute(
+        "UPDATE predictions_history SET result = ? WHERE id = ?",
+        results,
+        many=True
+    )
+
+
+def _day_range(date_str):
+    """
+    Limites [início, fim) de um dia ('YYYY-MM-DD') no formato de date_added. Um intervalo,
+    ao contrário de LIKE 'YYYY-MM-DD%' (que não diferencia maiúsculas e por isso não usa
+    o índice), vira uma busca por faixa em idx_predictions_date_added.
+    """
+    day = date.fromisoformat(date_str)
+    return f"{day.isoformat()} 00:00:00", f"{(day + timedelta(days=1)).isoformat()} 00:00:00"
 
 
 def get_daily_predictions_summary(date_str):
@@ -197,18 +815,56 @@ def get_daily_predictions_summary(date_str):
     date_str no formato 'YYYY-MM-DD'.
     Retorna lista de tuplas: (id, fixture_id, prediction, confidence, suggested_odd, result)
     """
-    conn = sqlite3.connect("zeus_tips.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, fixture_id, prediction, confidence, suggested_odd, result "
-        "FROM predictions_history WHERE date_added LIKE ?",
-        (f"{date_str}%",)
-    )
-    results = cursor.fetchall()
-    conn.close()
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, fixture_id, prediction, confidence, suggested_odd, result "
+            "FROM predictions_history WHERE date_added >= ? AND date_added < ?",
+            _day_range(date_str)
+        )
+        results = cursor.fetchall()
     return results
 
 
+def get_daily_summary_stats(date_str):
+    """
+    Calcula no próprio SQLite os números do resumo de um dia ('YYYY-MM-DD').
+    Retorna (total, greens, reds, pendentes, lucro, unidades apostadas), onde cada green
+    rende (odd - 1) e cada red custa 1 unidade.
+    """
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COUNT(*), "
+            "COUNT(*) FILTER (WHERE result = 'green'), "
+            "COUNT(*) FILTER (WHERE result = 'red'), "
+            "COUNT(*) FILTER (WHERE result IS NULL OR result NOT IN ('green', 'red')), "
+            "COALESCE(SUM(CASE WHEN result = 'green' THEN COALESCE(suggested_odd, 0) - 1 "
+            "WHEN result = 'red' THEN -1 ELSE 0 END), 0), "
+            "COUNT(*) FILTER (WHERE result IN ('green', 'red')) "
+            "FROM predictions_history WHERE date_added >= ? AND date_added < ?",
+            _day_range(date_str)
+        )
+        result = cursor.fetchone()
+    return result
+
+
+def get_admin_stats():
+    """
+    Números do /admin_estatisticas numa única consulta: assinantes ativos (busca no índice
+    status/end_date) e os contadores de palpites de stats_snapshot.
+    Retorna (ativos, total, greens, reds, pendentes).
+    """
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT (SELECT COUNT(*) FROM subscribers WHERE status = 'active'), "
+            "total, greens, reds, pending FROM stats_snapshot WHERE id = 1"
+        )
+        result = cursor.fetchone()
+    return result
+
+
 if __name__ == "__main__":
     init_db()
     print("Banco de dados 'zeus_tips.db' inicializado com sucesso.")
@@ -1,52 +1,48 @@
 
-import schedule
-import time
-import threading
 import asyncio
-from datetime import datetime, timedelta
-
-# Importar a função de envio de palpites do bot.py
-# É importante que esta função seja capaz de ser chamada de forma assíncrona
-# e que tenha acesso ao `application` do bot.
-
-def run_continuously(interval=1):
-    """Continuously run pending jobs every 'interval' seconds."""
-    cease_continuous_run = threading.Event()
-
-    class ScheduleThread(threading.Thread):
-        @classmethod
-        def run(cls):
-            while not cease_continuous_run.is_set():
-                schedule.run_pending()
-                time.sleep(interval)
-
-    continuous_thread = ScheduleThread()
-    continuous_thread.start()
-    return cease_continuous_run
+import logging
+from datetime import datetime, time, timedelta, timezone, tzinfo
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+# Agendamento simples, todo em asyncio: uma única task dorme até o próximo horário e
+# dispara o envio, sem thread em segundo plano nem a biblioteca `schedule`.
+# O bot principal agenda seus jobs pela JobQueue do python-telegram-bot; este módulo
+# serve para rodar o envio diário fora dela.
+
+# Horário de Brasília pelo banco de fusos (acompanha um eventual horário de verão); sem
+# os dados de fuso no sistema (pacote tzdata), usa o GMT-3 fixo
+BRAZIL_TZ: tzinfo
+try:
+    BRAZIL_TZ = ZoneInfo("America/Sao_Paulo")
+except ZoneInfoNotFoundError:
+    BRAZIL_TZ = timezone(timedelta(hours=-3))
+
+# 12:00 no horário de Brasília, independente do fuso do servidor
+DAILY_PREDICTIONS_TIME = time(hour=12, minute=0)
+
+def seconds_until(at: time, tz=BRAZIL_TZ) -> float:
+    """Segundos até a próxima ocorrência do horário de parede `at` no fuso `tz`."""
+    now = datetime.now(tz)
+    next_run = datetime.combine(now.date(), at, tzinfo=tz)
+    if next_run <= now:
+        next_run = datetime.combine(now.date() + timedelta(days=1), at, tzinfo=tz)
+    # Diferença em UTC: com ZoneInfo, subtrair datetimes do mesmo fuso ignoraria a troca de offset
+    return (next_run.astimezone(timezone.utc) - now.astimezone(timezone.utc)).total_seconds()
 
 async def schedule_daily_predictions(application):
-    # A função send_daily_predictions precisa ser um coroutine
-    # e precisa do objeto `application` para enviar mensagens.
-    # Para agendar uma função assíncrona com `schedule`, precisamos envolvê-la.
-    async def job():
-        from bot import send_daily_predictions # Importar aqui para evitar circular dependency
-        await send_daily_predictions(application)
-
-    # Agendar para meio-dia (12:00) horário de Brasília (GMT-3)
-    # Se o servidor estiver em UTC, 12:00 BRT é 15:00 UTC
-    schedule.every().day.at("15:00").do(lambda: asyncio.create_task(job()))
-    print("Agendamento diário de palpites configurado para 12:00 BRT.")
-
-
-# Exemplo de como iniciar o scheduler (será chamado do main do bot)
-# if __name__ == "__main__":
-#     # Isso é apenas um exemplo. O `application` real virá do bot principal.
-#     class MockApplication:
-#         def create_task(self, coro):
-#             asyncio.run(coro)
-#
-#     mock_app = MockApplication()
-#     asyncio.run(schedule_daily_predictions(mock_app))
-#     stop_run_continuously = run_continuously()
-#     # Para parar o scheduler, chame stop_run_continuously.set()
-
+    """
+    Envia os palpites diários todo dia no DAILY_PREDICTIONS_TIME. Deve ser iniciada como
+    task no event loop do bot, ex.: `application.create_task(schedule_daily_predictions(application))`.
+    A Application serve como contexto: expõe `.bot` como o contexto dos jobs.
+    """
+    from bot import send_daily_predictions # Importar aqui para evitar circular dependency
+
+    logger.info("Agendamento diário de palpites configurado para 12:00 BRT.")
+    while True:
+        await asyncio.sleep(seconds_until(DAILY_PREDICTIONS_TIME))
+        try:
+            await send_daily_predictions(application)
+        except Exception as e:
+            logger.error(f"Erro no envio diário de palpites agendado: {e}")